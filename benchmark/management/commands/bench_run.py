@@ -0,0 +1,60 @@
+import json
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from benchmark.runner import compare, run
+from benchmark.seed import bench_users
+from benchmark.smtp_sink import SMTPSink
+
+
+class Command(BaseCommand):
+    """
+    Команда для замеров производительности рассылки и страниц
+    """
+    help = "Замеряет тик рассылки и страницы и сохраняет результаты в JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=20, help="Запросов на страницу")
+        parser.add_argument(
+            "--dispatch-repeat", type=int, default=1, help="Прогонов тика рассылки"
+        )
+        parser.add_argument("--skip-dispatch", action="store_true", help="Без замера рассылки")
+        parser.add_argument(
+            "--output", "-o", default="bench_results.json", help="Файл для результатов"
+        )
+        parser.add_argument("--baseline", help="Результаты прошлого прогона для сравнения")
+
+    def handle(self, *args, **options):
+        if not bench_users().exists():
+            raise CommandError("Нет данных для замеров: сначала запустите bench_seed")
+        with SMTPSink((settings.EMAIL_HOST, int(settings.EMAIL_PORT))) as sink:
+            sink.start()
+            results = run(
+                sink,
+                repeat=options["repeat"],
+                dispatch_repeat=options["dispatch_repeat"],
+                skip_dispatch=options["skip_dispatch"],
+            )
+            sink.shutdown()
+        with open(options["output"], "w", encoding="utf-8") as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+        self.stdout.write(f"Результаты записаны в {options['output']}")
+
+        for name, view in results["views"].items():
+            self.stdout.write(
+                f"{name}: {view['status']}, запросов {view['queries']}, "
+                f"p50 {view['p50_ms']} мс, p95 {view['p95_ms']} мс"
+            )
+        if "dispatch" in results:
+            best = results["dispatch"]["best"]
+            self.stdout.write(
+                f"Рассылка: {best['mailings']} рассылок за {best['total_seconds']} с, "
+                f"{best['mailings_per_second']} рассылок/с, запросов {best['queries']}"
+            )
+
+        if options["baseline"]:
+            with open(options["baseline"], encoding="utf-8") as file:
+                baseline = json.load(file)
+            for name, old, new, change in compare(baseline, results):
+                self.stdout.write(f"{name}: {old} -> {new} ({change:+.1f}%)")
@@ -0,0 +1,23 @@
+from django.core.management import BaseCommand
+
+from benchmark.seed import SCALES, reset, seed
+
+
+class Command(BaseCommand):
+    """
+    Команда для заполнения БД синтетическими данными для замеров
+    """
+    help = "Заполняет БД синтетическими пользователями, клиентами, рассылками и попытками"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", choices=SCALES, default="1k", help="Масштаб данных")
+        parser.add_argument("--seed", type=int, default=0, help="Зерно генератора данных")
+        parser.add_argument(
+            "--reset", action="store_true", help="Удалить прежние данные замеров"
+        )
+
+    def handle(self, *args, **options):
+        if options["reset"]:
+            self.stdout.write(f"Удалено объектов: {reset()}")
+        sizes = seed(options["scale"], options["seed"])
+        self.stdout.write(f"Создано для масштаба {options['scale']}: {sizes}")
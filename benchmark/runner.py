@@ -0,0 +1,240 @@
+import platform
+import statistics
+import subprocess
+import time
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client as TestClient
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from benchmark.seed import bench_users, make_due
+from message.metrics import ExecuteWrapper
+from message.models import Attempt, Client, DeliveryJob, MailingList, Message
+from message.services import drain_outbox, periodicity_sending
+
+RESULTS_VERSION = 1
+
+
+class QueryCounter(ExecuteWrapper):
+    """
+    Считает SQL-запросы во всех соединениях, в том числе открытых
+    рабочими потоками рассылки во время замера
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def counting(self):
+        connection.ensure_connection()
+        return self.installed()
+
+
+def _timings(values):
+    """
+    Сводка замеров в миллисекундах
+    """
+    values = sorted(value * 1000 for value in values)
+    return {
+        "mean_ms": round(statistics.fmean(values), 3),
+        "p50_ms": round(values[len(values) // 2], 3),
+        "p95_ms": round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+        "max_ms": round(values[-1], 3),
+    }
+
+
+def git_revision():
+    """
+    Текущий коммит (если проект в git-репозитории)
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    """
+    Условия замера: версия кода, БД, кеш и основные настройки рассылки
+    """
+    users = bench_users()
+    return {
+        "revision": git_revision(),
+        "started_at": timezone.now().isoformat(),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": connection.vendor,
+        "cache": settings.CACHES["default"]["BACKEND"].rsplit(".", 1)[-1],
+        "settings": {
+            name: getattr(settings, name)
+            for name in (
+                "DISPATCH_EXECUTOR",
+                "DISPATCH_MAX_WORKERS",
+                "DISPATCH_PER_HOST_LIMIT",
+                "DISPATCH_CLAIM_BATCH_SIZE",
+                "MAILING_CHUNK_SIZE",
+                "MAILING_PREFETCH_CLIENTS",
+                "ATTEMPT_BATCH_SIZE",
+            )
+        },
+        "data": {
+            "users": users.count(),
+            "clients": Client.objects.filter(owner__in=users).count(),
+            "mailings": MailingList.objects.filter(owner__in=users).count(),
+            "attempts": Attempt.objects.filter(mailing_list__owner__in=users).count(),
+        },
+    }
+
+
+def measure_dispatch(sink, repeat=1):
+    """
+    Пропускная способность тика рассылки (periodicity_sending) и полной
+    отправки очереди: все рассылки замера делаются готовыми к отправке,
+    после тика очередь досылается drain_outbox до конца
+    """
+    runs = []
+    for _ in range(repeat):
+        DeliveryJob.objects.filter(mailing_list__owner__in=bench_users()).delete()
+        mailings = make_due()
+        sink.reset()
+        counter = QueryCounter()
+        with override_settings(OUTBOX_DRAIN_IN_TICK=True), counter.counting():
+            started = time.perf_counter()
+            report = periodicity_sending()
+            tick_elapsed = time.perf_counter() - started
+            while drain_outbox().submitted:
+                pass
+            total_elapsed = time.perf_counter() - started
+        runs.append(
+            {
+                "mailings": mailings,
+                "tick_seconds": round(tick_elapsed, 4),
+                "tick_succeeded": report.succeeded,
+                "tick_deferred": report.deferred,
+                "total_seconds": round(total_elapsed, 4),
+                "mailings_per_second": round(mailings / total_elapsed, 2),
+                "messages_per_second": round(sink.stats["messages"] / total_elapsed, 2),
+                "recipients_per_second": round(sink.stats["recipients"] / total_elapsed, 2),
+                "smtp_messages": sink.stats["messages"],
+                "smtp_recipients": sink.stats["recipients"],
+                "queries": counter.count,
+            }
+        )
+    best = max(runs, key=lambda run: run["mailings_per_second"])
+    return {"best": best, "runs": runs}
+
+
+def measure_url(client, url, repeat, before=None):
+    """
+    Время ответа и количество запросов к БД для одной страницы
+    """
+    durations, queries, status = [], [], None
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        counter = QueryCounter()
+        with counter.counting():
+            started = time.perf_counter()
+            response = client.get(url)
+            if response.streaming:
+                b"".join(response.streaming_content)
+            durations.append(time.perf_counter() - started)
+        queries.append(counter.count)
+        status = response.status_code
+    return {"url": url, "status": status, "queries": max(queries), **_timings(durations)}
+
+
+def bench_urls(user):
+    """
+    Страницы для замера (объекты берутся у пользователя замера)
+    """
+    message = Message.objects.filter(owner=user).first()
+    client = Client.objects.filter(owner=user).first()
+    mailing = MailingList.objects.filter(owner=user).first()
+    urls = {
+        "message_list": reverse("message:message_view"),
+        "client_list": reverse("message:client_view"),
+        "mailinglist_list": reverse("message:mailinglist_view"),
+    }
+    if message is not None:
+        urls["message_detail"] = reverse("message:message_detail", args=[message.pk])
+    if client is not None:
+        urls["client_detail"] = reverse("message:client_detail", args=[client.pk])
+    if mailing is not None:
+        urls["mailinglist_detail"] = reverse("message:mailinglist_detail", args=[mailing.pk])
+        urls["attempt_list"] = reverse("message:attempt_list", args=[mailing.pk])
+    return urls
+
+
+def measure_views(repeat=20):
+    """
+    Главная страница (с пустым и с заполненным кешем) и страницы пользователя
+    """
+    user = bench_users().order_by("pk").first()
+    client = TestClient()
+    client.force_login(user)
+    home = reverse("message:home_page_view")
+    client.get(home)
+    results = {
+        "home_page_cold": measure_url(client, home, repeat, before=cache.clear),
+        "home_page_warm": measure_url(client, home, repeat),
+    }
+    for name, url in bench_urls(user).items():
+        client.get(url)
+        results[name] = measure_url(client, url, repeat)
+    return results
+
+
+def run(sink, repeat=20, dispatch_repeat=1, skip_dispatch=False):
+    """
+    Полный набор замеров; результат - словарь для сохранения в JSON
+    """
+    results = {"version": RESULTS_VERSION, "environment": environment()}
+    results["views"] = measure_views(repeat)
+    if not skip_dispatch:
+        results["dispatch"] = measure_dispatch(sink, dispatch_repeat)
+    return results
+
+
+def flatten(results, prefix=""):
+    """
+    Числовые метрики результата в виде {"views.home_page_warm.p50_ms": 1.2}
+    """
+    metrics = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if key in ("environment", "runs", "version", "status"):
+            continue
+        if isinstance(value, dict):
+            metrics.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[name] = value
+    return metrics
+
+
+def compare(baseline, results):
+    """
+    Сравнение с результатами другого прогона: (метрика, было, стало, изменение в %)
+    """
+    old, new = flatten(baseline), flatten(results)
+    rows = []
+    for name in sorted(old.keys() & new.keys()):
+        change = (new[name] - old[name]) / old[name] * 100 if old[name] else 0.0
+        rows.append((name, old[name], new[name], round(change, 1)))
+    return rows
@@ -0,0 +1,179 @@
+import random
+from datetime import timedelta
+from itertools import islice
+
+from django.db import transaction
+from django.utils import timezone
+
+from message.models import Attempt, Client, MailingList, Message
+from message.stats import rebuild_mailing_stats
+from users.models import User
+
+BENCH_EMAIL_DOMAIN = "bench.example.com"
+BATCH_SIZE = 5000
+
+# Масштабы данных: пользователи, клиенты, рассылки (по одному сообщению на рассылку),
+# клиентов в рассылке, попыток отправки
+SCALES = {
+    "1k": {
+        "users": 10,
+        "clients": 1_000,
+        "mailings": 50,
+        "clients_per_mailing": 20,
+        "attempts": 10_000,
+    },
+    "100k": {
+        "users": 100,
+        "clients": 100_000,
+        "mailings": 1_000,
+        "clients_per_mailing": 100,
+        "attempts": 100_000,
+    },
+    "1m": {
+        "users": 1_000,
+        "clients": 1_000_000,
+        "mailings": 10_000,
+        "clients_per_mailing": 100,
+        "attempts": 1_000_000,
+    },
+}
+
+
+def _batched(objects, batch_size=BATCH_SIZE):
+    """
+    Делит поток объектов на пачки, не создавая весь список в памяти
+    """
+    objects = iter(objects)
+    while batch := list(islice(objects, batch_size)):
+        yield batch
+
+
+def _bulk_create(model, objects):
+    """
+    Пакетная вставка потока объектов
+    """
+    for batch in _batched(objects):
+        model.objects.bulk_create(batch)
+
+
+def bench_users():
+    """
+    Пользователи, созданные для замеров
+    """
+    return User.objects.filter(email__endswith=f"@{BENCH_EMAIL_DOMAIN}")
+
+
+def reset():
+    """
+    Удаляет данные замеров (клиенты, сообщения и рассылки удаляются каскадно)
+    """
+    return bench_users().delete()[0]
+
+
+def seed(scale, seed_value=0):
+    """
+    Заполняет БД синтетическими данными заданного масштаба.
+    Данные детерминированы seed_value, поэтому прогоны на разных коммитах сравнимы.
+    Все рассылки запущены и их дата отправки уже наступила
+    """
+    sizes = SCALES[scale]
+    rng = random.Random(seed_value)
+    now = timezone.now()
+
+    with transaction.atomic():
+        users = []
+        for number in range(sizes["users"]):
+            user = User(email=f"user-{number}@{BENCH_EMAIL_DOMAIN}")
+            user.set_unusable_password()
+            users.append(user)
+        User.objects.bulk_create(users)
+        user_ids = list(bench_users().order_by("pk").values_list("pk", flat=True))
+
+        _bulk_create(
+            Client,
+            (
+                Client(
+                    name=f"Клиент {number}",
+                    email=f"client-{number}@{BENCH_EMAIL_DOMAIN}",
+                    comment=f"Комментарий {number}",
+                    owner_id=user_ids[number % len(user_ids)],
+                )
+                for number in range(sizes["clients"])
+            ),
+        )
+        client_ids = list(
+            Client.objects.filter(owner_id__in=user_ids)
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+
+        _bulk_create(
+            Message,
+            (
+                Message(
+                    title_letter=f"Рассылка {number}",
+                    body_letter="Текст рассылки для замеров производительности",
+                    owner_id=user_ids[number % len(user_ids)],
+                )
+                for number in range(sizes["mailings"])
+            ),
+        )
+        message_ids = list(
+            Message.objects.filter(owner_id__in=user_ids)
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+        periodicities = [choice for choice, _ in MailingList.PERIODICITY_CHOICES]
+        _bulk_create(
+            MailingList,
+            (
+                MailingList(
+                    message_id=message_id,
+                    owner_id=user_ids[number % len(user_ids)],
+                    status="Запущена",
+                    periodicity=rng.choice(periodicities),
+                    date_and_time_of_sending=now - timedelta(days=rng.randint(1, 60)),
+                    next_date=now - timedelta(minutes=1),
+                )
+                for number, message_id in enumerate(message_ids)
+            ),
+        )
+        mailing_ids = list(
+            MailingList.objects.filter(owner_id__in=user_ids)
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+
+        per_mailing = min(sizes["clients_per_mailing"], len(client_ids))
+        _bulk_create(
+            MailingList.clients.through,
+            (
+                MailingList.clients.through(mailinglist_id=mailing_id, client_id=client_id)
+                for mailing_id in mailing_ids
+                for client_id in rng.sample(client_ids, per_mailing)
+            ),
+        )
+
+        statuses = [choice for choice, _ in Attempt.STATUS_CHOICES]
+        _bulk_create(
+            Attempt,
+            (
+                Attempt(
+                    mailing_list_id=mailing_ids[number % len(mailing_ids)],
+                    status=rng.choice(statuses),
+                    mail_server_response="Синтетическая попытка",
+                )
+                for number in range(sizes["attempts"])
+            ),
+        )
+    rebuild_mailing_stats(MailingList.objects.filter(pk__in=mailing_ids))
+    return sizes
+
+
+def make_due():
+    """
+    Делает все рассылки замеров готовыми к отправке
+    """
+    return MailingList.objects.filter(owner__in=bench_users()).update(
+        status="Запущена", next_date=timezone.now() - timedelta(minutes=1)
+    )
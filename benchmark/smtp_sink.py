@@ -0,0 +1,99 @@
+import socketserver
+import threading
+from collections import Counter
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """
+    Минимальный SMTP-диалог: принимает любые письма (кроме адресов из server.refused)
+    и ничего с ними не делает
+    """
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        stats = self.server.stats
+        with self.server.lock:
+            stats["connections"] += 1
+        self.reply("220 bench ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip().upper()
+            if command.startswith("EHLO"):
+                self.wfile.write(b"250-bench\r\n250-8BITMIME\r\n250 SMTPUTF8\r\n")
+            elif command.startswith("NOOP"):
+                with self.server.lock:
+                    stats["noops"] += 1
+                self.reply("250 OK")
+            elif command.startswith(("HELO", "MAIL", "RSET")):
+                self.reply("250 OK")
+            elif command.startswith("RCPT"):
+                address = line.decode(errors="replace").strip().partition(":")[2].strip("<> ")
+                if address.lower() in self.server.refused:
+                    self.reply("550 5.1.1 User unknown")
+                    continue
+                with self.server.lock:
+                    stats["recipients"] += 1
+                self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                size = 0
+                for data in self.rfile:
+                    if data in (b".\r\n", b".\n"):
+                        break
+                    size += len(data)
+                with self.server.lock:
+                    stats["messages"] += 1
+                    stats["bytes"] += size
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """
+    Фейковый SMTP-сервер для замеров и тестов: считает соединения, команды NOOP,
+    письма, адресатов и байты.
+    Адреса из refused отклоняются на RCPT TO кодом 550.
+
+        with SMTPSink(("127.0.0.1", 8026)) as sink:
+            sink.start()
+            ...
+            print(sink.stats)
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, _SMTPHandler)
+        self.stats = Counter()
+        self.refused = set()
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Запускает сервер в фоновом потоке
+        """
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+            self.refused.clear()
+
+
+if __name__ == "__main__":
+    import sys
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8026
+    with SMTPSink(("127.0.0.1", port)) as sink:
+        print(f"SMTP sink on 127.0.0.1:{port}")
+        sink.serve_forever()
@@ -0,0 +1,135 @@
+import atexit
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, F, Value, When
+
+from blog.models import Blog
+
+VIEW_COUNT_KEY = "blog_view_count:{pk}"
+FLUSH_LOCK_KEY = "blog_view_count:flush_lock"
+# Сброс, не снявший блокировку (процесс упал), не мешает следующим дольше этого
+FLUSH_LOCK_TIMEOUT = 300
+
+_pending = Counter()
+_lock = threading.Lock()
+_flushed_at = time.monotonic()
+
+
+def _use_cache():
+    """
+    Копить просмотры в общем кеше (Redis) или в памяти процесса
+    """
+    return settings.BLOG_VIEW_COUNTER == "cache"
+
+
+def record_view(pk):
+    """
+    Учитывает просмотр публикации без записи в БД.
+    В режиме "cache" счетчик увеличивается атомарно в кеше (INCR в Redis)
+    и сбрасывается в БД кроном flush_view_counts; в режиме "memory" копится
+    в памяти процесса и сбрасывается им же раз в BLOG_VIEW_FLUSH_INTERVAL секунд
+    """
+    if _use_cache():
+        key = VIEW_COUNT_KEY.format(pk=pk)
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+        return
+    global _flushed_at
+    with _lock:
+        _pending[pk] += 1
+        due = time.monotonic() - _flushed_at >= settings.BLOG_VIEW_FLUSH_INTERVAL
+        if due:
+            _flushed_at = time.monotonic()
+    if due:
+        flush_view_counts()
+
+
+def pending_views(pk):
+    """
+    Просмотры публикации, еще не записанные в БД
+    """
+    if _use_cache():
+        return cache.get(VIEW_COUNT_KEY.format(pk=pk), 0)
+    with _lock:
+        return _pending[pk]
+
+
+def live_view_count(blog: Blog):
+    """
+    Текущее количество просмотров с учетом еще не записанных в БД
+    """
+    return blog.count_view + pending_views(blog.pk)
+
+
+def _take_pending():
+    """
+    Забирает накопленные просмотры: {pk: количество}
+    """
+    if not _use_cache():
+        with _lock:
+            counts = dict(_pending)
+            _pending.clear()
+        return counts
+    pks = Blog.objects.values_list("pk", flat=True)
+    keys = {VIEW_COUNT_KEY.format(pk=pk): pk for pk in pks}
+    counts = {}
+    for key, value in cache.get_many(keys).items():
+        if value:
+            # DECR, а не delete: просмотры, пришедшие после чтения, не теряются
+            cache.decr(key, value)
+            counts[keys[key]] = value
+    return counts
+
+
+@contextmanager
+def _flush_lock():
+    """
+    Блокировка сброса счетчиков из кеша (cache.add атомарен): между чтением
+    и DECR другой узел не заберет те же просмотры второй раз.
+    Возвращает False, если сброс уже выполняет другой процесс
+    """
+    if not _use_cache():
+        yield True
+        return
+    token = uuid.uuid4().hex
+    if not cache.add(FLUSH_LOCK_KEY, token, timeout=FLUSH_LOCK_TIMEOUT):
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        if cache.get(FLUSH_LOCK_KEY) == token:
+            cache.delete(FLUSH_LOCK_KEY)
+
+
+def flush_view_counts():
+    """
+    Записывает накопленные просмотры в Blog.count_view одним запросом
+    UPDATE ... SET count_view = count_view + CASE ... END.
+    Возвращает количество записанных просмотров (0, если сброс уже идет на другом узле)
+    """
+    with _flush_lock() as locked:
+        counts = _take_pending() if locked else {}
+    if not counts:
+        return 0
+    increment = Case(
+        *[When(pk=pk, then=Value(count)) for pk, count in counts.items()],
+        default=Value(0),
+    )
+    Blog.objects.filter(pk__in=counts).update(count_view=F("count_view") + increment)
+    return sum(counts.values())
+
+
+@atexit.register
+def _flush_on_exit():
+    """
+    Сохраняет просмотры из памяти процесса при его завершении
+    """
+    if not _use_cache() and _pending:
+        flush_view_counts()
@@ -0,0 +1,13 @@
+from django.core.management import BaseCommand
+
+from blog.counters import flush_view_counts
+
+
+class Command(BaseCommand):
+    """
+    Команда для записи накопленных просмотров публикаций в БД
+    """
+    help = "Записывает накопленные просмотры публикаций блога в БД"
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Записано просмотров: {flush_view_counts()}")
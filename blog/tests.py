@@ -1,3 +1,39 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from blog.counters import flush_view_counts, pending_views, record_view
+from blog.models import Blog
+
+
+@override_settings(BLOG_VIEW_COUNTER="cache")
+class ViewCounterTestCase(TestCase):
+    """
+    Сброс просмотров из кеша в БД
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.blog = Blog.objects.create(tittle="Публикация", content_article="Текст")
+
+    def test_concurrent_flush_takes_views_once(self):
+        for _ in range(3):
+            record_view(self.blog.pk)
+        get_many = cache.get_many
+        nested = []
+
+        def racing_get_many(keys):
+            # Второй узел начинает сброс, пока первый еще не уменьшил счетчики
+            values = get_many(keys)
+            nested.append(flush_view_counts())
+            return values
+
+        with mock.patch.object(cache, "get_many", racing_get_many):
+            written = flush_view_counts()
+
+        self.assertEqual(written, 3)
+        self.assertEqual(nested, [0])
+        self.blog.refresh_from_db()
+        self.assertEqual(self.blog.count_view, 3)
+        self.assertEqual(pending_views(self.blog.pk), 0)
@@ -2,10 +2,14 @@ from django.urls import path
 from django.views.decorators.cache import cache_page
 
 from blog.apps import BlogConfig
-from blog.views import BlogDetailView
+from blog.views import BlogDetailView, count_view
 
 app_name = BlogConfig.name
 
 urlpatterns = [
-    path("<int:pk>/", cache_page(200)(BlogDetailView.as_view()), name="blog_detail")
+    path(
+        "<int:pk>/",
+        count_view(cache_page(200)(BlogDetailView.as_view())),
+        name="blog_detail",
+    )
 ]
\ No newline at end of file
@@ -1,6 +1,9 @@
+from functools import wraps
+
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.views.generic import DetailView
 
+from blog.counters import live_view_count, record_view
 from blog.models import Blog
 
 
@@ -12,11 +15,24 @@ class BlogDetailView(LoginRequiredMixin, PermissionRequiredMixin, DetailView):
     model = Blog
     permission_required = "blog.view_blog"
 
-    def get_object(self, queryset=None):
+    def get_context_data(self, **kwargs):
         """
-        Получает публикацию блога с увеличением счетчика просмотров
+        Добавляет количество просмотров с учетом еще не записанных в БД
         """
-        self.object = super().get_object(queryset)
-        self.object.count_view += 1
-        self.object.save(update_fields=["count_view"])
-        return self.object
\ No newline at end of file
+        context = super().get_context_data(**kwargs)
+        context["count_view"] = live_view_count(self.object)
+        return context
+
+
+def count_view(view):
+    """
+    Учитывает просмотр публикации при каждом успешном ответе,
+    в том числе отданном из кеша страницы (cache_page)
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            record_view(kwargs["pk"])
+        return response
+    return wrapper
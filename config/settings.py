@@ -28,6 +28,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'message.middleware.QueryProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -87,10 +88,79 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Тик планировщика раз в минуту. Вместо crontab можно запустить демон: manage.py run_scheduler
 CRONJOBS = [
     ("*/1 * * * *", "message.services.periodicity_sending"),
+    ("*/1 * * * *", "blog.counters.flush_view_counts"),
 ]
 
+# Параллельная отправка рассылок
+# thread | process | asyncio (нужен aiosmtplib)
+DISPATCH_EXECUTOR = os.getenv("DISPATCH_EXECUTOR", "thread")
+DISPATCH_MAX_WORKERS = int(os.getenv("DISPATCH_MAX_WORKERS", 8))
+DISPATCH_PER_HOST_LIMIT = int(os.getenv("DISPATCH_PER_HOST_LIMIT", 4))
+DISPATCH_TICK_DEADLINE = float(os.getenv("DISPATCH_TICK_DEADLINE", 50))
+# Сколько рассылок/заданий обработчик захватывает за раз и на сколько секунд (больше дедлайна тика)
+DISPATCH_CLAIM_BATCH_SIZE = int(os.getenv("DISPATCH_CLAIM_BATCH_SIZE", 100))
+DISPATCH_LEASE_SECONDS = int(os.getenv("DISPATCH_LEASE_SECONDS", 300))
+
+# Размер пачки адресов в одном письме (ограничение RCPT на сервере)
+MAILING_CHUNK_SIZE = int(os.getenv("MAILING_CHUNK_SIZE", 100))
+
+# Демон планировщика (manage.py run_scheduler): максимальный сон и полная пересинхронизация, сек
+# (без PostgreSQL LISTEN/NOTIFY рассылки перечитываются раз в SCHEDULER_MAX_SLEEP)
+SCHEDULER_MAX_SLEEP = float(os.getenv("SCHEDULER_MAX_SLEEP", 60))
+SCHEDULER_RESYNC_INTERVAL = float(os.getenv("SCHEDULER_RESYNC_INTERVAL", 600))
+
+# Что делать с пропущенными отправками (например, после простоя): skip | coalesce | replay
+MAILING_CATCH_UP_POLICY = os.getenv("MAILING_CATCH_UP_POLICY", "coalesce")
+MAILING_MISFIRE_GRACE = int(os.getenv("MAILING_MISFIRE_GRACE", 3600))
+
+# Исходящая очередь заданий на отправку
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 5))
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", 60))
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", 3600))
+# Отправлять очередь прямо в тике планировщика (выключить, если запущены отдельные drain_outbox)
+OUTBOX_DRAIN_IN_TICK = os.getenv("OUTBOX_DRAIN_IN_TICK", "True") == "True"
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 5))
+
+# Подгружать адреса клиентов всех захваченных рассылок одним запросом (до
+# DISPATCH_CLAIM_BATCH_SIZE рассылок целиком в памяти). Имеет смысл только для небольших
+# списков; по умолчанию адреса читаются потоком и память не растет с размером списка
+MAILING_PREFETCH_CLIENTS = os.getenv("MAILING_PREFETCH_CLIENTS", "False") == "True"
+
+# Сколько скомпилированных шаблонов писем с полями подстановки хранить в памяти процесса
+PERSONALIZATION_CACHE_SIZE = int(os.getenv("PERSONALIZATION_CACHE_SIZE", 128))
+
+# Размер пачки при записи попыток и дат отправки в БД
+ATTEMPT_BATCH_SIZE = int(os.getenv("ATTEMPT_BATCH_SIZE", 500))
+
+# Количество попыток отправки на странице отчета
+ATTEMPT_PAGE_SIZE = int(os.getenv("ATTEMPT_PAGE_SIZE", 50))
+
+# Размер страницы списков сообщений, клиентов и рассылок (по умолчанию и наибольший для ?per_page=)
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", 24))
+LIST_MAX_PAGE_SIZE = int(os.getenv("LIST_MAX_PAGE_SIZE", 100))
+
+# Сколько строк читать из БД за раз при выгрузке попыток отправки
+ATTEMPT_EXPORT_CHUNK_SIZE = int(os.getenv("ATTEMPT_EXPORT_CHUNK_SIZE", 2000))
+
+# Хранение журнала попыток: старше скольких дней переносить в архив и куда
+ATTEMPT_RETENTION_DAYS = int(os.getenv("ATTEMPT_RETENTION_DAYS", 180))
+ATTEMPT_ARCHIVE_DIR = os.getenv("ATTEMPT_ARCHIVE_DIR", BASE_DIR / "archive")
+# Запускать архивацию кроном каждую ночь (по умолчанию только вручную)
+ATTEMPT_ARCHIVE_NIGHTLY = os.getenv("ATTEMPT_ARCHIVE_NIGHTLY", "False") == "True"
+if ATTEMPT_ARCHIVE_NIGHTLY:
+    CRONJOBS.append(("0 3 * * *", "django.core.management.call_command", ["archive_attempts"]))
+
+# Размер пачки при импорте клиентов из файла
+CLIENT_IMPORT_BATCH_SIZE = int(os.getenv("CLIENT_IMPORT_BATCH_SIZE", 1000))
+
+# Пул SMTP-соединений
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", DISPATCH_PER_HOST_LIMIT))
+SMTP_POOL_MAX_IDLE = float(os.getenv("SMTP_POOL_MAX_IDLE", 60))
+SMTP_POOL_ACQUIRE_TIMEOUT = float(os.getenv("SMTP_POOL_ACQUIRE_TIMEOUT", 30))
+
 
 LANGUAGE_CODE = 'ru-ru'
 
@@ -132,4 +202,36 @@ if CACHE_ENABLED:
             'BACKEND': 'django.core.cache.backends.redis.RedisCache',
             'LOCATION': os.getenv('LOCATION')
         }
-    }
\ No newline at end of file
+    }
+
+# Где копить просмотры публикаций до записи в БД: cache (общий Redis) | memory (память процесса)
+BLOG_VIEW_COUNTER = os.getenv("BLOG_VIEW_COUNTER", "cache" if CACHE_ENABLED else "memory")
+# Как часто процесс записывает просмотры из памяти в БД (для memory), сек
+BLOG_VIEW_FLUSH_INTERVAL = float(os.getenv("BLOG_VIEW_FLUSH_INTERVAL", 30))
+
+# Время жизни страниц списков в кеше владельца (кеш также сбрасывается сменой версии владельца)
+OWNER_CACHE_TIMEOUT = int(os.getenv("OWNER_CACHE_TIMEOUT", 600))
+
+# Время жизни счетчиков главной страницы (кеш также сбрасывается сигналами)
+HOME_PAGE_CACHE_TIMEOUT = int(os.getenv("HOME_PAGE_CACHE_TIMEOUT", 300))
+HOME_PAGE_BLOG_POOL = int(os.getenv("HOME_PAGE_BLOG_POOL", 30))
+
+# Как часто процесс сбрасывает метрики (/metrics) из памяти в общий кеш, сек
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 10))
+# Токен для доступа к /metrics (Authorization: Bearer <токен>); без него - только персонал
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Профилирование запросов к БД по HTTP-запросам (заголовок Server-Timing и предупреждения в логе)
+QUERY_PROFILING = os.getenv("QUERY_PROFILING", "False") == "True"
+# Бюджет запросов к БД на страницу: по умолчанию и по имени URL
+# (QUERY_BUDGETS=message:home_page_view=5,message:mailinglist_detail=8)
+QUERY_BUDGET_DEFAULT = int(os.getenv("QUERY_BUDGET_DEFAULT", 20))
+QUERY_BUDGETS = {
+    name: int(budget)
+    for name, budget in (
+        item.rsplit("=", 1) for item in os.getenv("QUERY_BUDGETS", "").split(",") if item
+    )
+}
+# Каталог для дампов cProfile запросов медленнее QUERY_PROFILE_SLOW_MS (пусто - не профилировать)
+QUERY_PROFILE_DIR = os.getenv("QUERY_PROFILE_DIR", "")
+QUERY_PROFILE_SLOW_MS = float(os.getenv("QUERY_PROFILE_SLOW_MS", 500))
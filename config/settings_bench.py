@@ -0,0 +1,44 @@
+"""
+Настройки для замеров производительности (python manage.py bench_seed / bench_run).
+БД выбирается переменной BENCH_DB: sqlite (файл bench.sqlite3) или postgres
+(отдельная база BENCH_DB_NAME на том же сервере, что и основная).
+Кеш - в памяти процесса, если не задан BENCH_CACHE=redis
+"""
+import os
+
+from config.settings import *  # noqa: F401,F403
+from config.settings import BASE_DIR, DATABASES, INSTALLED_APPS
+
+SECRET_KEY = os.getenv("SECRET_KEY") or "benchmark"
+DEBUG = False
+ALLOWED_HOSTS = ["testserver", "localhost", "127.0.0.1"]
+
+INSTALLED_APPS = INSTALLED_APPS + ["benchmark"]
+
+if os.getenv("BENCH_DB", "sqlite") == "postgres":
+    DATABASES = {
+        "default": {
+            **DATABASES["default"],
+            "NAME": os.getenv("BENCH_DB_NAME", "kyrs6_bench"),
+        }
+    }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.getenv("BENCH_DB_NAME", BASE_DIR / "bench.sqlite3"),
+        }
+    }
+    # SQLite не переносит параллельную запись из нескольких потоков
+    DISPATCH_MAX_WORKERS = 1
+
+if os.getenv("BENCH_CACHE") != "redis":
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+# Письма уходят на локальный фейковый SMTP-сервер (bench_run поднимает его сам)
+EMAIL_HOST = os.getenv("BENCH_SMTP_HOST", "127.0.0.1")
+EMAIL_PORT = int(os.getenv("BENCH_SMTP_PORT", 8026))
+EMAIL_HOST_USER = "bench@example.com"
+EMAIL_HOST_PASSWORD = ""
+EMAIL_USE_TLS = False
+EMAIL_USE_SSL = False
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from message.models import Message, Client, MailingList, Attempt
+from message.models import Message, Client, MailingList, Attempt, DeliveryJob, MailingStats
 
 
 @admin.register(Message)
@@ -53,4 +53,35 @@ class AttemptAdmin(admin.ModelAdmin):
         "mailing_list",
         "status",
     )
-    search_fields = ("mailing_list", "mail_server_response")
\ No newline at end of file
+    search_fields = ("mailing_list", "mail_server_response")
+
+
+@admin.register(DeliveryJob)
+class DeliveryJobAdmin(admin.ModelAdmin):
+    """
+    Админка модели DeliveryJob
+    """
+    list_display = (
+        "id",
+        "mailing_list",
+        "status",
+        "attempts_count",
+        "available_at",
+        "last_error",
+    )
+    list_filter = ("status",)
+    search_fields = ("last_error",)
+
+
+@admin.register(MailingStats)
+class MailingStatsAdmin(admin.ModelAdmin):
+    """
+    Админка модели MailingStats
+    """
+    list_display = (
+        "mailing_list",
+        "total",
+        "successful",
+        "failed",
+        "last_attempt_at",
+    )
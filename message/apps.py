@@ -5,3 +5,6 @@ class MessageConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'message'
     verbose_name = 'Рассылки'
+
+    def ready(self):
+        import message.signals  # noqa: F401
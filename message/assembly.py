@@ -0,0 +1,73 @@
+from email import policy
+from smtplib import SMTP
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.core.mail.message import sanitize_address
+
+from message.models import Message
+
+
+class PreparedMessage:
+    """
+    Письмо рассылки, собранное в MIME один раз на отправку.
+    Тема и текст кодируются и заголовки сворачиваются один раз; для каждой пачки
+    к готовым байтам добавляется только заголовок To, а адреса пачки передаются
+    в конверте SMTP (RCPT TO)
+    """
+
+    def __init__(self, message: Message, from_email):
+        email = EmailMessage(message.title_letter, message.body_letter, from_email)
+        self.encoding = email.encoding or settings.DEFAULT_CHARSET
+        self.from_email = sanitize_address(from_email, self.encoding)
+        self.data = email.message().as_bytes(linesep="\r\n")
+
+    def envelope(self, recipients):
+        """
+        Адреса пачки для конверта SMTP и заголовка To
+        """
+        return envelope_addresses(recipients, self.encoding)
+
+    def to_header(self, recipients):
+        """
+        Свернутый заголовок To для пачки адресов (уже подготовленных envelope)
+        """
+        return policy.SMTP.fold("To", ", ".join(recipients)).encode()
+
+    def for_recipients(self, recipients):
+        """
+        Байты письма для пачки адресов (уже подготовленных envelope)
+        """
+        return self.to_header(recipients) + self.data
+
+
+def envelope_addresses(addresses, encoding=None):
+    """
+    Адреса в том виде, в котором их отправляет Django (sanitize_address):
+    интернациональный домен (user@пример.рф) переводится в punycode,
+    иначе smtplib не сможет закодировать команду RCPT TO
+    """
+    encoding = encoding or settings.DEFAULT_CHARSET
+    return [sanitize_address(address, encoding) for address in addresses]
+
+
+def raw_smtp(connection):
+    """
+    smtplib.SMTP открытого SMTP-бэкенда или None для других бэкендов (locmem, console)
+    """
+    smtp = getattr(connection, "connection", None)
+    return smtp if isinstance(smtp, SMTP) else None
+
+
+def refused_summary(refused):
+    """
+    Текст для попытки об адресах, которые сервер отклонил (RCPT TO)
+    """
+    if not refused:
+        return ""
+    details = []
+    for address, (code, response) in list(refused.items())[:5]:
+        if isinstance(response, bytes):
+            response = response.decode(errors="replace")
+        details.append(f"{address}: {code} {response}")
+    return f", отклонено адресов: {len(refused)} ({'; '.join(details)})"
@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from message.assembly import PreparedMessage, envelope_addresses, refused_summary
+from message.dispatch import DispatchReport, default_host_of
+from message.metrics import (
+    SEND_RECIPIENTS,
+    SEND_SECONDS,
+    SMTP_SECONDS,
+    record_attempts,
+    record_job,
+)
+from message.models import Attempt, MailingList
+from message.recorder import AttemptRecorder
+from message.outbox import (
+    claim_jobs,
+    delivery_error,
+    finish_job,
+    partial_delivery_error,
+    release_job,
+)
+from message.personalization import MERGE_FIELDS, is_personalized, personalized_emails
+from message.scheduling import prefetched_clients
+
+try:
+    import aiosmtplib
+except ImportError:  # pragma: no cover
+    aiosmtplib = None
+
+logger = logging.getLogger(__name__)
+
+
+async def aiter_recipient_chunks(item: MailingList, personalized=False, chunk_size=None):
+    """
+    Асинхронно выбирает клиентов рассылки пачками
+    (для персональных писем - словари с полями MERGE_FIELDS)
+    """
+    chunk_size = chunk_size or settings.MAILING_CHUNK_SIZE
+    clients = prefetched_clients(item)
+    if clients is not None:
+        if personalized:
+            rows = [
+                {field: getattr(client, field) for field in MERGE_FIELDS} for client in clients
+            ]
+        else:
+            rows = [client.email for client in clients]
+        for start in range(0, len(rows), chunk_size):
+            yield rows[start:start + chunk_size]
+        return
+    clients = item.clients.order_by("pk")
+    if personalized:
+        clients = clients.values(*MERGE_FIELDS)
+    else:
+        clients = clients.values_list("email", flat=True)
+    chunk = []
+    async for row in clients.aiterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _smtp_client():
+    """
+    Создает асинхронный SMTP-клиент по настройкам EMAIL_*
+    """
+    credentials = {}
+    if settings.EMAIL_HOST_USER and settings.EMAIL_HOST_PASSWORD:
+        credentials = {
+            "username": settings.EMAIL_HOST_USER,
+            "password": settings.EMAIL_HOST_PASSWORD,
+        }
+    return aiosmtplib.SMTP(
+        hostname=settings.EMAIL_HOST,
+        port=int(settings.EMAIL_PORT) if settings.EMAIL_PORT else None,
+        use_tls=settings.EMAIL_USE_SSL,
+        start_tls=settings.EMAIL_USE_TLS or None,
+        **credentials,
+    )
+
+
+async def asend_personalized(smtp, emails):
+    """
+    Асинхронно отправляет персональные письма пачки по одному (см. send_personalized).
+    Возвращает (число доставленных писем, отклоненные адреса {адрес: (код, ответ)})
+    """
+    delivered, refused = 0, {}
+    for email in emails:
+        try:
+            await smtp.send_message(
+                email.message(),
+                sender=email.from_email,
+                recipients=envelope_addresses(email.recipients(), email.encoding),
+            )
+        except aiosmtplib.SMTPRecipientsRefused as error:
+            refused.update({item.recipient: (item.code, item.message) for item in error.recipients})
+        except aiosmtplib.SMTPResponseException as error:
+            refused.update({address: (error.code, error.message) for address in email.to})
+        else:
+            delivered += 1
+    return delivered, refused
+
+
+async def asending_a_message(item: MailingList, attempts: list):
+    """
+    Асинхронная отправка рассылки пачками адресов в одной SMTP-сессии.
+    Попытки не сохраняются сразу, а добавляются в attempts для пакетной записи
+    """
+    started = time.perf_counter()
+    sent_chunks = 0
+    recipients_count = 0
+    personalized = is_personalized(item.message.body_letter)
+    if not personalized:
+        prepared = PreparedMessage(item.message, settings.EMAIL_HOST_USER)
+    try:
+        async with _smtp_client() as smtp:
+            async for recipients in aiter_recipient_chunks(item, personalized):
+                sent_chunks += 1
+                prefix = f"Пачка {sent_chunks} ({len(recipients)} адр.)"
+                refused = {}
+                delivered = True
+                recipients_count += len(recipients)
+                chunk_started = time.perf_counter()
+                try:
+                    if personalized:
+                        delivered, refused = await asend_personalized(
+                            smtp,
+                            personalized_emails(item.message, recipients, settings.EMAIL_HOST_USER),
+                        )
+                    else:
+                        envelope = prepared.envelope(recipients)
+                        refused, _ = await smtp.sendmail(
+                            prepared.from_email, envelope, prepared.for_recipients(envelope)
+                        )
+                except Exception as message:
+                    SMTP_SECONDS.observe(time.perf_counter() - chunk_started)
+                    attempts.append(
+                        Attempt(mailing_list=item, mail_server_response=f"{prefix}: {message}")
+                    )
+                    if not isinstance(message, aiosmtplib.SMTPException):
+                        logger.exception("Ошибка при отправке %s рассылки %s", prefix, item)
+                        # Как в deliver_mailing: незавершенная транзакция SMTP
+                        # не должна перейти в следующую пачку
+                        smtp.close()
+                        await smtp.connect()
+                else:
+                    SMTP_SECONDS.observe(time.perf_counter() - chunk_started)
+                    attempts.append(
+                        Attempt(
+                            mailing_list=item,
+                            status="Успешно" if delivered else "Не успешно",
+                            mail_server_response=(
+                                f"{prefix}: {'Доставлено' if delivered else 'Не доставлено'}"
+                                f"{refused_summary(refused)}"
+                            ),
+                        )
+                    )
+    except (aiosmtplib.SMTPException, OSError) as message:
+        attempts.append(Attempt(mailing_list=item, mail_server_response=f"{message}"))
+    else:
+        if not sent_chunks:
+            attempts.append(
+                Attempt(mailing_list=item, mail_server_response="У рассылки нет клиентов")
+            )
+    SEND_SECONDS.observe(time.perf_counter() - started)
+    SEND_RECIPIENTS.observe(recipients_count)
+    record_attempts(attempts)
+
+
+async def drain_outbox_async(deadline=None):
+    """
+    Отправляет задания исходящей очереди конкурентно в одном цикле событий.
+    Задания захватываются через claim_jobs не больше, чем может отправляться
+    одновременно (DISPATCH_PER_HOST_LIMIT на каждый SMTP-хост), поэтому
+    аренда не ставится на всю очередь сразу. На дедлайне отменяются только задания,
+    которые еще ждут свободной SMTP-сессии; начатые отправки дожидаются завершения,
+    как в DispatchEngine. Попытки и состояние заданий записываются в БД пакетно
+    через AttemptRecorder
+    """
+    if aiosmtplib is None:
+        raise ImproperlyConfigured("Для DISPATCH_EXECUTOR = 'asyncio' нужен пакет aiosmtplib")
+    deadline = deadline if deadline is not None else settings.DISPATCH_TICK_DEADLINE
+    report = DispatchReport()
+    started = time.monotonic()
+    # Сброс в БД только через sync_to_async в конце: синхронный ORM
+    # внутри цикла событий вызвал бы SynchronousOnlyOperation
+    recorder = AttemptRecorder(autoflush=False)
+
+    semaphores = defaultdict(lambda: asyncio.Semaphore(settings.DISPATCH_PER_HOST_LIMIT))
+    sending = set()
+
+    async def run(job):
+        host = default_host_of(job)
+        attempts = []
+        async with semaphores[host]:
+            sending.add(job.pk)
+            await asending_a_message(job.mailing_list, attempts)
+        report.per_host[host] += 1
+        return attempts
+
+    def record(task, job):
+        if task.cancelled():
+            report.deferred += 1
+            recorder.save_job(release_job(job))
+        elif task.exception() is not None:
+            report.failed += 1
+            logger.error("Ошибка при отправке %s", job, exc_info=task.exception())
+            recorder.save_job(finish_job(job, f"{task.exception()}"))
+            record_job(job)
+        else:
+            attempts = task.result()
+            recorder.add_attempts(attempts)
+            recorder.save_job(finish_job(job, delivery_error(attempts), partial_delivery_error(attempts)))
+            record_job(job)
+            report.succeeded += 1
+
+    tasks = {}
+    hosts = set()
+    claiming = True
+    while True:
+        remaining = deadline - (time.monotonic() - started)
+        if remaining <= 0:
+            break
+        limit = settings.DISPATCH_PER_HOST_LIMIT * max(len(hosts), 1)
+        if claiming and len(tasks) < limit:
+            batch = await sync_to_async(claim_jobs)(
+                min(settings.DISPATCH_CLAIM_BATCH_SIZE, limit - len(tasks))
+            )
+            claiming = bool(batch)
+            for job in batch:
+                hosts.add(default_host_of(job))
+                tasks[asyncio.create_task(run(job))] = job
+                report.submitted += 1
+        if not tasks:
+            if not claiming:
+                break
+            continue
+        done, _ = await asyncio.wait(
+            tasks, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+        )
+        for task in done:
+            record(task, tasks.pop(task))
+
+    if tasks:
+        report.deadline_reached = True
+        for task, job in tasks.items():
+            if job.pk not in sending:
+                task.cancel()
+        await asyncio.wait(tasks)
+        for task, job in tasks.items():
+            record(task, job)
+
+    await sync_to_async(recorder.flush)()
+    report.elapsed = time.monotonic() - started
+    return report
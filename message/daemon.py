@@ -0,0 +1,235 @@
+import heapq
+import logging
+import select
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from message.models import DeliveryJob, MailingList
+from message.services import periodicity_sending
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "mailing_changed"
+
+
+def notify_mailing_changed(pk):
+    """
+    Сообщает демону планировщика об изменении рассылки через PostgreSQL NOTIFY.
+    На других СУБД демон узнает об изменениях при периодической пересинхронизации
+    """
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_notify(%s, %s)", [NOTIFY_CHANNEL, str(pk)])
+
+
+class SchedulerDaemon:
+    """
+    Долгоживущий планировщик рассылок вместо запуска тика из crontab раз в минуту.
+    Даты следующей отправки запущенных рассылок загружаются один раз и хранятся
+    в куче (min-heap) по next_date; демон спит до ближайшей даты и просыпается
+    раньше, если рассылка изменилась (LISTEN mailing_changed).
+    Подписка держится на отдельном соединении, которое не закрывается
+    close_old_connections, поэтому уведомления во время тика не теряются.
+    Рабочие соединения закрываются по CONN_MAX_AGE, как в конце HTTP-запроса.
+    Без PostgreSQL уведомлений нет, и рассылки перечитываются раз в max_sleep
+    """
+
+    def __init__(self, resync_interval=None, max_sleep=None):
+        self.resync_interval = resync_interval or settings.SCHEDULER_RESYNC_INTERVAL
+        self.max_sleep = max_sleep or settings.SCHEDULER_MAX_SLEEP
+        self._heap = []
+        self._next_dates = {}
+        self._next_job_at = None
+        self._listener = None
+        self._resync_at = 0
+
+    def resync(self):
+        """
+        Полностью перечитывает даты отправки запущенных рассылок из БД
+        """
+        rows = MailingList.objects.filter(
+            status="Запущена", next_date__isnull=False
+        ).values_list("next_date", "pk")
+        self._heap = list(rows)
+        heapq.heapify(self._heap)
+        self._next_dates = {pk: next_date for next_date, pk in self._heap}
+        self._refresh_next_job()
+        self._resync_at = time.monotonic() + self.resync_period()
+        logger.info("Планировщик: загружено рассылок - %s", len(self._heap))
+
+    def refresh(self, pks):
+        """
+        Перечитывает даты отправки отдельных рассылок. Устаревшие записи
+        остаются в куче и пропускаются при извлечении
+        """
+        pks = set(pks)
+        for pk in pks:
+            self._next_dates.pop(pk, None)
+        rows = MailingList.objects.filter(
+            pk__in=pks, status="Запущена", next_date__isnull=False
+        ).values_list("next_date", "pk")
+        for next_date, pk in rows:
+            self._next_dates[pk] = next_date
+            heapq.heappush(self._heap, (next_date, pk))
+
+    def _refresh_next_job(self):
+        """
+        Ближайшая дата повтора свободных заданий исходящей очереди
+        (если очередь отправляется в тике планировщика)
+        """
+        if not settings.OUTBOX_DRAIN_IN_TICK:
+            self._next_job_at = None
+            return
+        now = timezone.now()
+        self._next_job_at = DeliveryJob.objects.filter(
+            Q(locked_until__isnull=True) | Q(locked_until__lt=now),
+            status="В очереди",
+        ).aggregate(next_at=Min("available_at"))["next_at"]
+
+    def _peek(self):
+        """
+        Ближайшая актуальная дата отправки или None
+        """
+        while self._heap:
+            next_date, pk = self._heap[0]
+            if self._next_dates.get(pk) == next_date:
+                return next_date
+            heapq.heappop(self._heap)
+        return None
+
+    def _pop_due(self, now):
+        """
+        Извлекает из кучи все рассылки, дата которых наступила
+        """
+        due = []
+        while self._peek() is not None and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[1])
+        return due
+
+    def resync_period(self):
+        """
+        Как часто полностью перечитывать рассылки: без LISTEN/NOTIFY (не PostgreSQL)
+        изменения рассылок видны только при пересинхронизации
+        """
+        if connection.vendor != "postgresql":
+            return min(self.resync_interval, self.max_sleep)
+        return self.resync_interval
+
+    def _listen(self):
+        """
+        Отдельное соединение с подпиской на канал уведомлений (None без PostgreSQL).
+        Новая подписка назначает полную пересинхронизацию: уведомления,
+        отправленные до нее, демон не получил
+        """
+        if connection.vendor != "postgresql":
+            return None
+        if self._listener is None or self._listener.closed:
+            listener = connection.get_new_connection(connection.get_connection_params())
+            listener.autocommit = True
+            with listener.cursor() as cursor:
+                cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+            self._listener = listener
+            self._resync_at = 0
+        return self._listener
+
+    def _close_listener(self):
+        """
+        Закрывает соединение подписки (после ошибки оно создается заново)
+        """
+        if self._listener is not None:
+            try:
+                self._listener.close()
+            except Exception:
+                logger.exception("Планировщик: не удалось закрыть соединение подписки")
+            self._listener = None
+
+    def wait(self, timeout):
+        """
+        Спит timeout секунд или до уведомления об изменении рассылки.
+        Возвращает первичные ключи измененных рассылок
+        """
+        raw = self._listen()
+        if not self._resync_at:
+            # Подписка создана заново - сначала перечитать рассылки
+            return []
+        if raw is None or not hasattr(raw, "poll"):
+            time.sleep(timeout)
+            return []
+        select.select([raw], [], [], timeout)
+        raw.poll()
+        changed = []
+        while raw.notifies:
+            notify = raw.notifies.pop(0)
+            if notify.payload.isdigit():
+                changed.append(int(notify.payload))
+        return changed
+
+    def sleep_time(self, now):
+        """
+        Сколько спать до ближайшей отправки, повтора задания или пересинхронизации
+        """
+        moments = [
+            moment for moment in (self._peek(), self._next_job_at) if moment is not None
+        ]
+        timeout = min(
+            [self.max_sleep, self._resync_at - time.monotonic()]
+            + [(moment - now).total_seconds() for moment in moments]
+        )
+        return max(timeout, 0)
+
+    def run_once(self):
+        """
+        Одна итерация: отправка наступивших рассылок, затем ожидание
+        """
+        close_old_connections()
+        self._listen()
+        if time.monotonic() >= self._resync_at:
+            self.resync()
+        now = timezone.now()
+        due = self._pop_due(now)
+        job_due = self._next_job_at is not None and self._next_job_at <= now
+        if due or job_due:
+            report = periodicity_sending()
+            logger.info("Планировщик: тик для %s рассылок, %s", len(due), report)
+            self.refresh(due)
+            self._refresh_next_job()
+        changed = self.wait(self.sleep_time(timezone.now()))
+        close_old_connections()
+        if changed:
+            self.refresh(changed)
+
+    def run_forever(self):
+        """
+        Основной цикл демона. Ошибка итерации (например, потеря соединения с БД)
+        пишется в лог, после паузы (растет вдвое до max_sleep) соединение
+        открывается заново и рассылки перечитываются целиком
+        """
+        failures = 0
+        while True:
+            try:
+                self.run_once()
+            except Exception:
+                failures += 1
+                delay = min(2 ** failures, self.max_sleep)
+                logger.exception("Планировщик: ошибка итерации, повтор через %s с", delay)
+                self._recover()
+                time.sleep(delay)
+            else:
+                failures = 0
+
+    def _recover(self):
+        """
+        Сбрасывает состояние после ошибки: соединения закрываются, подписка
+        на канал и даты рассылок восстанавливаются на следующей итерации
+        """
+        try:
+            connection.close()
+        except Exception:
+            logger.exception("Планировщик: не удалось закрыть соединение с БД")
+        self._close_listener()
+        self._resync_at = 0
@@ -0,0 +1,201 @@
+import logging
+import time
+from collections import Counter, deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import dataclass, field
+
+from django import db
+from django.conf import settings
+
+from message import metrics
+
+logger = logging.getLogger(__name__)
+
+EXECUTORS = {
+    "thread": ThreadPoolExecutor,
+    "process": ProcessPoolExecutor,
+}
+
+
+@dataclass
+class DispatchReport:
+    """
+    Итоги одного тика рассылки
+    """
+    submitted: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    deferred: int = 0
+    elapsed: float = 0.0
+    deadline_reached: bool = False
+    per_host: Counter = field(default_factory=Counter)
+
+    @property
+    def throughput(self):
+        """
+        Количество обработанных рассылок в секунду
+        """
+        if not self.elapsed:
+            return 0.0
+        return (self.succeeded + self.failed) / self.elapsed
+
+    def merge(self, other):
+        """
+        Добавляет к отчету итоги другой пачки
+        """
+        self.submitted += other.submitted
+        self.succeeded += other.succeeded
+        self.failed += other.failed
+        self.deferred += other.deferred
+        self.elapsed += other.elapsed
+        self.deadline_reached = self.deadline_reached or other.deadline_reached
+        self.per_host.update(other.per_host)
+
+    def __str__(self):
+        return (
+            f"отправлено: {self.succeeded}, ошибок: {self.failed}, "
+            f"отложено: {self.deferred}, время: {self.elapsed:.2f} с, "
+            f"скорость: {self.throughput:.1f} рассылок/с"
+        )
+
+
+def default_host_of(item):
+    """
+    SMTP-хост, через который уходит рассылка
+    """
+    return settings.EMAIL_HOST or "localhost"
+
+
+def _run_job(func, item, flush_metrics=False):
+    """
+    Выполняет задачу в рабочем потоке/процессе и освобождает соединение с БД.
+    В дочернем процессе метрики сразу сбрасываются в общий кеш,
+    иначе они остались бы в памяти рабочего процесса
+    """
+    db.close_old_connections()
+    try:
+        return func(item)
+    finally:
+        db.close_old_connections()
+        if flush_metrics:
+            metrics.flush()
+
+
+class DispatchEngine:
+    """
+    Параллельная отправка рассылок на пуле потоков или процессов
+    с ограничением одновременных сессий на один SMTP-хост и дедлайном на тик
+    """
+
+    def __init__(
+        self,
+        executor=None,
+        max_workers=None,
+        per_host_limit=None,
+        deadline=None,
+        host_of=default_host_of,
+    ):
+        self.executor = executor or settings.DISPATCH_EXECUTOR
+        if self.executor not in EXECUTORS:
+            raise ValueError(f"Неизвестный тип пула: {self.executor}")
+        self.max_workers = max_workers or settings.DISPATCH_MAX_WORKERS
+        self.per_host_limit = per_host_limit or settings.DISPATCH_PER_HOST_LIMIT
+        self.deadline = deadline if deadline is not None else settings.DISPATCH_TICK_DEADLINE
+        self.host_of = host_of
+
+    def _make_pool(self):
+        """
+        Создает пул исполнителей нужного типа
+        """
+        if self.executor == "process":
+            # Дочерние процессы не должны унаследовать открытые сокеты БД
+            db.connections.close_all()
+        return EXECUTORS[self.executor](max_workers=self.max_workers)
+
+    def run(self, items, func, on_success=None, on_failure=None):
+        """
+        Выполняет func для каждого элемента items.
+        on_success(item, result) вызывается в вызывающем потоке для каждого успешно
+        обработанного элемента с результатом func(item), on_failure(item, error) -
+        для элементов, на которых func выбросила исключение.
+        Элементы, которые не успели запуститься до дедлайна, считаются отложенными
+        """
+        report = DispatchReport()
+        flush_metrics = self.executor == "process"
+        queues = {}
+        for item in items:
+            queues.setdefault(self.host_of(item), deque()).append(item)
+        if not queues:
+            return report
+
+        started = time.monotonic()
+        deadline_at = started + self.deadline
+        host_load = Counter()
+        in_flight = {}
+
+        with self._make_pool() as pool:
+            while queues or in_flight:
+                if time.monotonic() >= deadline_at:
+                    report.deadline_reached = True
+                    break
+                for host in list(queues):
+                    queue = queues[host]
+                    while (
+                        queue
+                        and len(in_flight) < self.max_workers
+                        and host_load[host] < self.per_host_limit
+                    ):
+                        item = queue.popleft()
+                        future = pool.submit(_run_job, func, item, flush_metrics)
+                        in_flight[future] = (item, host)
+                        host_load[host] += 1
+                        report.submitted += 1
+                    if not queue:
+                        del queues[host]
+                if not in_flight:
+                    continue
+                done, _ = wait(
+                    in_flight,
+                    timeout=max(deadline_at - time.monotonic(), 0),
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in done:
+                    self._collect(future, in_flight, host_load, report, on_success, on_failure)
+
+            # Дедлайн: новые задачи не запускаем, дожидаемся уже начатых
+            for future in list(in_flight):
+                if future.cancel():
+                    in_flight.pop(future)
+                    report.submitted -= 1
+                    report.deferred += 1
+            for future in wait(in_flight).done:
+                self._collect(future, in_flight, host_load, report, on_success, on_failure)
+
+        report.deferred += sum(len(queue) for queue in queues.values())
+        report.elapsed = time.monotonic() - started
+        return report
+
+    @staticmethod
+    def _collect(future, in_flight, host_load, report, on_success, on_failure):
+        """
+        Учитывает результат завершившейся задачи
+        """
+        item, host = in_flight.pop(future)
+        host_load[host] -= 1
+        try:
+            result = future.result()
+        except Exception as error:
+            report.failed += 1
+            logger.exception("Ошибка при отправке %s", item)
+            if on_failure is not None:
+                on_failure(item, error)
+            return
+        report.succeeded += 1
+        report.per_host[host] += 1
+        if on_success is not None:
+            on_success(item, result)
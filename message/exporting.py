@@ -0,0 +1,138 @@
+import csv
+import json
+import zlib
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from message.models import Attempt
+
+EXPORT_FORMATS = ("csv", "jsonl")
+EXPORT_FIELDS = (
+    "id",
+    "mailing_list_id",
+    "date_time_last_attempt",
+    "status",
+    "mail_server_response",
+)
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+}
+# Сколько байт набирать перед отдачей клиенту, чтобы не отправлять каждую строку отдельно
+STREAM_BUFFER_SIZE = 64 * 1024
+
+
+def day_start(day):
+    """
+    Начало дня в текущем часовом поясе
+    """
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def filter_attempts(mailing=None, status=None, date_from=None, date_to=None, owner=None):
+    """
+    Попытки отправки для выгрузки, отсортированные по id.
+    Даты - включительно; фильтр по дате строится как диапазон по
+    date_time_last_attempt, чтобы работал индекс
+    """
+    attempts = Attempt.objects.all()
+    if owner is not None:
+        attempts = attempts.filter(mailing_list__owner=owner)
+    if mailing is not None:
+        attempts = attempts.filter(mailing_list=mailing)
+    if status:
+        attempts = attempts.filter(status=status)
+    if date_from:
+        attempts = attempts.filter(date_time_last_attempt__gte=day_start(date_from))
+    if date_to:
+        attempts = attempts.filter(
+            date_time_last_attempt__lt=day_start(date_to + timedelta(days=1))
+        )
+    return attempts.order_by("id")
+
+
+def iter_rows(attempts, chunk_size=None):
+    """
+    Строки выгрузки. На PostgreSQL .iterator() читает через серверный курсор
+    пачками по ATTEMPT_EXPORT_CHUNK_SIZE, и в памяти не бывает больше одной пачки
+    """
+    chunk_size = chunk_size or settings.ATTEMPT_EXPORT_CHUNK_SIZE
+    for row in attempts.values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size):
+        row = dict(zip(EXPORT_FIELDS, row))
+        row["date_time_last_attempt"] = row["date_time_last_attempt"].isoformat()
+        yield row
+
+
+class _Echo:
+    """
+    Псевдофайл для csv.writer: возвращает записанную строку вместо записи
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    """
+    Строки CSV с заголовком
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(row.values())
+
+
+def iter_jsonl(rows):
+    """
+    Строки JSON Lines
+    """
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+
+
+def iter_buffered(lines):
+    """
+    Склеивает строки в блоки байт размером около STREAM_BUFFER_SIZE
+    """
+    buffer, size = [], 0
+    for line in lines:
+        data = line.encode()
+        buffer.append(data)
+        size += len(data)
+        if size >= STREAM_BUFFER_SIZE:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def iter_gzip(blocks):
+    """
+    Сжимает поток блоков в gzip на лету
+    """
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for block in blocks:
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_attempts(attempts, export_format="csv", compress=False):
+    """
+    Потоковая выгрузка попыток отправки в CSV или JSONL (при compress - в gzip).
+    Возвращает итератор блоков байт для StreamingHttpResponse или записи в файл
+    """
+    lines = iter_csv if export_format == "csv" else iter_jsonl
+    blocks = iter_buffered(lines(iter_rows(attempts)))
+    return iter_gzip(blocks) if compress else blocks
+
+
+def export_file_name(export_format, compress=False):
+    """
+    Имя файла выгрузки
+    """
+    name = f"attempts-{timezone.localdate():%Y-%m-%d}.{export_format}"
+    return f"{name}.gz" if compress else name
@@ -1,9 +1,23 @@
 from datetime import datetime
 
 from django.core.exceptions import ValidationError
-from django.forms import ModelForm, BooleanField, TextInput, DateTimeField
-
-from message.models import Message, Client, MailingList
+from django.template import TemplateSyntaxError
+from django.forms import (
+    ModelForm,
+    BooleanField,
+    TextInput,
+    DateTimeField,
+    Form,
+    FileField,
+    ChoiceField,
+    DateField,
+    ModelChoiceField,
+)
+
+from message.exporting import EXPORT_FORMATS
+from message.importing import CSV_ENCODINGS, import_format
+from message.personalization import compile_text
+from message.models import Message, Client, MailingList, Attempt
 
 
 class StyleFormMixin:
@@ -32,6 +46,18 @@ class MessageForm(StyleFormMixin, ModelForm):
             "title_letter": TextInput(attrs={"placeholder": "Введите тему сообщения"}),
         }
 
+    def clean_body_letter(self):
+        """
+        Проверяет, что поля подстановки ({{ name }}, {{ email }}, {{ comment }})
+        записаны без ошибок
+        """
+        body_letter = self.cleaned_data["body_letter"]
+        try:
+            compile_text(body_letter)
+        except TemplateSyntaxError as error:
+            raise ValidationError(f"Ошибка в полях подстановки: {error}")
+        return body_letter
+
 
 class ClientForm(StyleFormMixin, ModelForm):
     """
@@ -47,6 +73,53 @@ class ClientForm(StyleFormMixin, ModelForm):
         }
 
 
+class ClientImportForm(StyleFormMixin, Form):
+    """
+    Форма для загрузки списка клиентов из файла
+    """
+    file = FileField(label="Файл CSV или XLSX (колонки email, name, comment)")
+    encoding = ChoiceField(
+        label="Кодировка CSV",
+        choices=[("", "Определить автоматически")]
+        + [(encoding, encoding) for encoding in CSV_ENCODINGS],
+        required=False,
+    )
+
+    def clean_file(self):
+        """
+        Проверяет формат загруженного файла
+        """
+        file = self.cleaned_data["file"]
+        self.file_format = import_format(file.name)
+        return file
+
+
+class AttemptExportForm(StyleFormMixin, Form):
+    """
+    Фильтры выгрузки попыток отправки
+    """
+    mailing = ModelChoiceField(
+        queryset=MailingList.objects.all(), required=False, label="Рассылка"
+    )
+    status = ChoiceField(
+        choices=[("", "Все")] + Attempt.STATUS_CHOICES, required=False, label="Статус"
+    )
+    date_from = DateField(required=False, label="С даты")
+    date_to = DateField(required=False, label="По дату")
+    format = ChoiceField(
+        choices=[(name, name) for name in EXPORT_FORMATS],
+        required=False,
+        label="Формат",
+    )
+    gzip = BooleanField(required=False, label="Сжать в gzip")
+
+    def __init__(self, *args, **kwargs):
+        user = kwargs.pop("user", None)
+        super().__init__(*args, **kwargs)
+        if user is not None and not (user.is_superuser or user.is_staff):
+            self.fields["mailing"].queryset = MailingList.objects.filter(owner=user)
+
+
 class MailingListForm(StyleFormMixin, ModelForm):
     """
     Форма для создания и изменения рассылки сообщения
@@ -0,0 +1,259 @@
+import codecs
+import csv
+import zlib
+from dataclasses import dataclass, field
+from itertools import islice
+from zipfile import BadZipFile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db.models.functions import Lower
+
+from message.models import Client
+from message.owner_cache import bump_owner_version
+from message.services import invalidate_home_page_counts
+
+IMPORT_FORMATS = ("csv", "xlsx")
+# Кодировки CSV в порядке проверки, если кодировка не указана
+CSV_ENCODINGS = ("utf-8", "cp1251")
+COLUMN_ALIASES = {
+    "email": ("email", "e-mail", "почта"),
+    "name": ("name", "фио", "ф.и.о", "ф.и.о.", "имя"),
+    "comment": ("comment", "комментарий"),
+}
+NAME_MAX_LENGTH = Client._meta.get_field("name").max_length
+ERRORS_TO_KEEP = 20
+
+
+@dataclass
+class ImportReport:
+    """
+    Итоги импорта клиентов
+    """
+    rows: int = 0
+    created: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    errors: list = field(default_factory=list)
+
+    def add_error(self, line, text):
+        """
+        Учитывает строку с ошибкой; сохраняются только первые ERRORS_TO_KEEP ошибок
+        """
+        self.invalid += 1
+        if len(self.errors) < ERRORS_TO_KEEP:
+            self.errors.append(f"Строка {line}: {text}")
+
+    def __str__(self):
+        return (
+            f"строк: {self.rows}, добавлено: {self.created}, "
+            f"уже были: {self.duplicates}, с ошибками: {self.invalid}"
+        )
+
+
+def import_format(file_name):
+    """
+    Формат файла по расширению
+    """
+    extension = file_name.rsplit(".", 1)[-1].lower()
+    if extension not in IMPORT_FORMATS:
+        raise ValidationError("Поддерживаются файлы CSV и XLSX")
+    return extension
+
+
+def normalize_email(value):
+    """
+    Приводит адрес к единому виду для проверки уникальности: без пробелов
+    по краям и в нижнем регистре
+    """
+    return str(value or "").strip().lower()
+
+
+def _column_index(header):
+    """
+    Номера колонок email, name и comment по строке заголовка
+    """
+    names = [str(cell or "").strip().lower() for cell in header]
+    columns = {}
+    for column, aliases in COLUMN_ALIASES.items():
+        for position, name in enumerate(names):
+            if name in aliases:
+                columns[column] = position
+                break
+    if "email" not in columns:
+        raise ValidationError("В первой строке файла нет колонки email")
+    return columns
+
+
+def _read_error(line, text):
+    """
+    Ошибка чтения файла с номером строки
+    """
+    return ValidationError(f"Строка {line}: {text}")
+
+
+def _decode_lines(file, encoding=None):
+    """
+    Построчно декодирует файл. Если кодировка не указана, проверяются
+    CSV_ENCODINGS по порядку: первая строка с не-ASCII символами,
+    которая декодировалась, определяет кодировку всего файла
+    """
+    encodings = [encoding] if encoding else list(CSV_ENCODINGS)
+    for line, raw in enumerate(file, start=1):
+        if line == 1:
+            raw = raw.removeprefix(codecs.BOM_UTF8)
+        while True:
+            try:
+                text = raw.decode(encodings[0])
+                break
+            except UnicodeDecodeError:
+                if len(encodings) == 1:
+                    raise _read_error(line, f"текст не в кодировке {encodings[0]}")
+                encodings.pop(0)
+        if not raw.isascii():
+            del encodings[1:]
+        yield text
+
+
+def _iter_csv(file, encoding=None):
+    """
+    Построчно читает CSV (разделитель определяется по первой строке)
+    """
+    lines = _decode_lines(file, encoding)
+    first = next(lines, "")
+    try:
+        dialect = csv.Sniffer().sniff(first, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(_chain_first(first, lines), dialect)
+    try:
+        yield from reader
+    except csv.Error as error:
+        raise _read_error(reader.line_num, f"ошибка формата CSV ({error})")
+
+
+def _chain_first(first, lines):
+    """
+    Возвращает первую строку обратно в поток строк
+    """
+    if first:
+        yield first
+    yield from lines
+
+
+def _iter_xlsx(file):
+    """
+    Построчно читает первый лист XLSX в режиме read_only (openpyxl не держит
+    весь документ в памяти)
+    """
+    try:
+        from openpyxl import load_workbook
+        from openpyxl.utils.exceptions import InvalidFileException
+    except ImportError:
+        raise ValidationError("Для импорта XLSX установите пакет openpyxl")
+    # Поврежденный архив или XML листа
+    errors = (BadZipFile, InvalidFileException, KeyError, ValueError, SyntaxError, zlib.error)
+    try:
+        workbook = load_workbook(file, read_only=True, data_only=True)
+    except errors as error:
+        raise ValidationError(f"Файл XLSX поврежден или имеет другой формат ({error})")
+    line = 0
+    try:
+        for line, row in enumerate(workbook.active.iter_rows(values_only=True), start=1):
+            yield row
+    except errors as error:
+        raise _read_error(line + 1, f"файл XLSX поврежден ({error})")
+    finally:
+        workbook.close()
+
+
+def iter_client_rows(file, file_format, report, encoding=None):
+    """
+    Построчно разбирает файл и возвращает пары (номер строки, Client) без сохранения.
+    Строки с некорректным адресом учитываются в report и пропускаются.
+    Файл, который не удается прочитать, вызывает ValidationError с номером строки
+    """
+    rows = _iter_csv(file, encoding) if file_format == "csv" else _iter_xlsx(file)
+    columns = _column_index(next(rows, ()))
+    for line, row in enumerate(rows, start=2):
+        if not any(row):
+            continue
+        report.rows += 1
+        values = {
+            column: row[position] if position < len(row) else None
+            for column, position in columns.items()
+        }
+        email = normalize_email(values["email"])
+        try:
+            validate_email(email)
+        except ValidationError:
+            report.add_error(line, f"некорректный email {email!r}")
+            continue
+        name = str(values.get("name") or "").strip() or email.split("@")[0]
+        comment = str(values.get("comment") or "").strip() or None
+        yield line, Client(name=name[:NAME_MAX_LENGTH], email=email, comment=comment)
+
+
+def import_clients(file, file_format, owner=None, batch_size=None, encoding=None):
+    """
+    Потоковый импорт клиентов из CSV/XLSX.
+    Файл читается построчно, в памяти держится только одна пачка из
+    CLIENT_IMPORT_BATCH_SIZE строк: дубликаты внутри пачки отбрасываются,
+    уже существующие адреса ищутся одним запросом по lower(email) без учета
+    регистра, остальные добавляются через bulk_create(ignore_conflicts=True)
+    (на случай параллельного импорта тех же адресов).
+    Если файл не удалось дочитать, ValidationError сообщает, сколько клиентов
+    из предыдущих пачек уже добавлено
+    """
+    batch_size = batch_size or settings.CLIENT_IMPORT_BATCH_SIZE
+    report = ImportReport()
+    rows = iter_client_rows(file, file_format, report, encoding)
+    try:
+        while True:
+            batch = {}
+            for line, client in islice(rows, batch_size):
+                if client.email in batch:
+                    report.duplicates += 1
+                    continue
+                client.owner = owner
+                batch[client.email] = client
+            if not batch:
+                break
+            _save_batch(batch, owner, report)
+    except ValidationError as error:
+        if not report.created:
+            raise
+        raise ValidationError(
+            f"{'; '.join(error.messages)}. Импорт остановлен, "
+            f"уже добавлено клиентов: {report.created}"
+        )
+    finally:
+        if report.created:
+            # bulk_create не отправляет сигналы post_save
+            invalidate_home_page_counts()
+            bump_owner_version(owner.pk if owner is not None else None)
+    return report
+
+
+def _save_batch(batch, owner, report):
+    """
+    Сохраняет пачку клиентов ({email в нижнем регистре: Client}), которых еще нет в базе
+    """
+    existing = set(
+        Client.objects.annotate(email_lower=Lower("email"))
+        .filter(email_lower__in=batch)
+        .values_list("email_lower", flat=True)
+    )
+    report.duplicates += len(existing)
+    new_clients = [client for email, client in batch.items() if email not in existing]
+    if not new_clients:
+        return
+    Client.objects.bulk_create(new_clients, ignore_conflicts=True)
+    # ignore_conflicts не сообщает, какие строки пропущены: добавленными
+    # считаются адреса пачки, которые теперь есть в базе у этого владельца
+    created = Client.objects.filter(
+        email__in=[client.email for client in new_clients], owner=owner
+    ).count()
+    report.created += created
+    report.duplicates += len(new_clients) - created
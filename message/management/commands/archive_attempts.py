@@ -0,0 +1,28 @@
+from django.core.management import BaseCommand
+
+from message.retention import archive_attempts
+
+
+class Command(BaseCommand):
+    """
+    Команда для переноса старых попыток отправки в архивные файлы
+    """
+    help = "Переносит попытки отправки старше ATTEMPT_RETENTION_DAYS в gzip-архивы по месяцам"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, help="Хранить в БД попытки за столько дней")
+        parser.add_argument(
+            "--no-delete", action="store_true", help="Только выгрузить, не удалять из БД"
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Только показать, что будет сделано")
+
+    def handle(self, *args, **options):
+        archived = archive_attempts(
+            retention_days=options["days"],
+            delete=not options["no_delete"],
+            dry_run=options["dry_run"],
+        )
+        for path, count in archived:
+            self.stdout.write(f"{path}: попыток {count}")
+        if not archived:
+            self.stdout.write("Нет попыток для архивации")
@@ -0,0 +1,30 @@
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from message.services import drain_outbox
+
+
+class Command(BaseCommand):
+    """
+    Команда для отправки заданий исходящей очереди отдельно от тика планировщика
+    """
+    help = "Отправляет задания исходящей очереди"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Работать постоянно, опрашивая очередь раз в OUTBOX_POLL_INTERVAL секунд",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            report = drain_outbox()
+            if report.submitted:
+                self.stdout.write(f"Очередь: {report}")
+            if not options["loop"]:
+                break
+            if not report.submitted:
+                time.sleep(settings.OUTBOX_POLL_INTERVAL)
@@ -0,0 +1,40 @@
+import sys
+from datetime import date
+
+from django.core.management import BaseCommand
+
+from message.exporting import EXPORT_FORMATS, export_attempts, filter_attempts
+from message.models import Attempt
+
+
+class Command(BaseCommand):
+    """
+    Команда для выгрузки истории попыток отправки
+    """
+    help = "Выгружает попытки отправки в CSV или JSONL (можно со сжатием gzip)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mailing", type=int, help="id рассылки")
+        parser.add_argument(
+            "--status", choices=[status for status, _ in Attempt.STATUS_CHOICES]
+        )
+        parser.add_argument("--from", dest="date_from", type=date.fromisoformat, help="ГГГГ-ММ-ДД")
+        parser.add_argument("--to", dest="date_to", type=date.fromisoformat, help="ГГГГ-ММ-ДД")
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+        parser.add_argument("--gzip", action="store_true", help="Сжать выгрузку в gzip")
+        parser.add_argument("--output", "-o", help="Файл выгрузки (по умолчанию stdout)")
+
+    def handle(self, *args, **options):
+        attempts = filter_attempts(
+            mailing=options["mailing"],
+            status=options["status"],
+            date_from=options["date_from"],
+            date_to=options["date_to"],
+        )
+        blocks = export_attempts(attempts, options["format"], options["gzip"])
+        if options["output"]:
+            with open(options["output"], "wb") as file:
+                file.writelines(blocks)
+        else:
+            sys.stdout.buffer.writelines(blocks)
+            sys.stdout.flush()
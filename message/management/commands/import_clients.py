@@ -0,0 +1,44 @@
+from django.core.exceptions import ValidationError
+from django.core.management import BaseCommand, CommandError
+
+from message.importing import CSV_ENCODINGS, import_clients, import_format
+from users.models import User
+
+
+class Command(BaseCommand):
+    """
+    Команда для импорта клиентов из файла CSV/XLSX
+    """
+    help = "Импортирует клиентов из файла CSV/XLSX (колонки email, name, comment)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Путь к файлу CSV или XLSX")
+        parser.add_argument("--owner", help="Email пользователя - владельца клиентов")
+        parser.add_argument("--batch-size", type=int, help="Размер пачки вставки")
+        parser.add_argument(
+            "--encoding",
+            choices=CSV_ENCODINGS,
+            help="Кодировка CSV (по умолчанию определяется автоматически)",
+        )
+
+    def handle(self, *args, **options):
+        owner = None
+        if options["owner"]:
+            owner = User.objects.filter(email=options["owner"]).first()
+            if owner is None:
+                raise CommandError(f"Пользователь {options['owner']} не найден")
+        try:
+            file_format = import_format(options["path"])
+            with open(options["path"], "rb") as file:
+                report = import_clients(
+                    file,
+                    file_format,
+                    owner=owner,
+                    batch_size=options["batch_size"],
+                    encoding=options["encoding"],
+                )
+        except (OSError, ValidationError) as error:
+            raise CommandError(error)
+        self.stdout.write(f"Импорт клиентов: {report}")
+        for error in report.errors:
+            self.stdout.write(error)
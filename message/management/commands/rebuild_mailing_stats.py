@@ -0,0 +1,23 @@
+from django.core.management import BaseCommand
+
+from message.models import MailingList
+from message.owner_cache import bump_all_owners
+from message.stats import rebuild_mailing_stats
+
+
+class Command(BaseCommand):
+    """
+    Команда для пересчета статистики рассылок по истории попыток
+    """
+    help = "Пересчитывает статистику рассылок по таблице попыток отправки"
+
+    def add_arguments(self, parser):
+        parser.add_argument("mailings", nargs="*", type=int, help="id рассылок (по умолчанию все)")
+
+    def handle(self, *args, **options):
+        mailings = MailingList.objects.all()
+        if options["mailings"]:
+            mailings = mailings.filter(pk__in=options["mailings"])
+        count = rebuild_mailing_stats(mailings)
+        bump_all_owners()
+        self.stdout.write(f"Статистика пересчитана для рассылок: {count}")
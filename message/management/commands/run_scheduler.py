@@ -0,0 +1,17 @@
+from django.core.management import BaseCommand
+
+from message.daemon import SchedulerDaemon
+
+
+class Command(BaseCommand):
+    """
+    Команда для запуска демона планировщика рассылок
+    """
+    help = "Запускает планировщик рассылок как постоянно работающий процесс"
+
+    def handle(self, *args, **options):
+        self.stdout.write("Планировщик рассылок запущен")
+        try:
+            SchedulerDaemon().run_forever()
+        except KeyboardInterrupt:
+            self.stdout.write("Планировщик рассылок остановлен")
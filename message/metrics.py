@@ -0,0 +1,315 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+
+METRICS_KEY_PREFIX = "metrics"
+METRICS_INDEX_KEY = "metrics:index"
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+ATTEMPT_RESULTS = {"Успешно": "success", "Не успешно": "failure"}
+JOB_RESULTS = {"Отправлено": "sent", "В очереди": "retry", "Не доставлено": "failed"}
+
+_registry = {}
+_pending = {}
+_gauges = {}
+_lock = threading.Lock()
+_flushed_at = time.monotonic()
+
+
+class Metric:
+    """
+    Базовая метрика. Значения копятся в памяти процесса и периодически
+    складываются в общий кеш (flush), поэтому /metrics показывает сумму
+    по всем процессам: веб-серверу, крону, обработчикам очереди
+    """
+    kind = None
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        _registry[name] = self
+
+    def _add(self, series, amount, **labels):
+        key = (series, tuple(sorted(labels.items())))
+        with _lock:
+            _pending[key] = _pending.get(key, 0) + amount
+        flush_if_due()
+
+
+class Counter(Metric):
+    """
+    Счетчик событий
+    """
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        self._add(f"{self.name}_total", int(amount), **labels)
+
+
+class Gauge(Metric):
+    """
+    Текущее значение (последнее записанное любым процессом)
+    """
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with _lock:
+            _gauges[(self.name, tuple(sorted(labels.items())))] = value
+
+
+class Histogram(Metric):
+    """
+    Распределение значений по корзинам (le - верхняя граница корзины).
+    Сумма хранится в кеше целым числом в единицах 1/scale
+    """
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets, scale=1):
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets)
+        self.scale = scale
+
+    def observe(self, value, **labels):
+        position = bisect.bisect_left(self.buckets, value)
+        le = str(self.buckets[position]) if position < len(self.buckets) else "+Inf"
+        self._add(f"{self.name}_bucket", 1, le=le, **labels)
+        self._add(f"{self.name}_sum", round(value * self.scale), **labels)
+        self._add(f"{self.name}_count", 1, **labels)
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Замеряет длительность блока в секундах
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+
+class ExecuteWrapper:
+    """
+    Обертка выполнения SQL (execute_wrapper) на время блока installed():
+    ставится на соединение текущего потока и на соединения, открытые за это время
+    (в том числе рабочими потоками рассылки). На каждом соединении обертка стоит
+    один раз, даже если поток переподключается, и снимается со всех соединений
+    при выходе из блока
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def __call__(self, execute, sql, params, many, context):
+        return execute(sql, params, many, context)
+
+    def _install(self, sender=None, connection=None, **kwargs):
+        with self._lock:
+            if self in connection.execute_wrappers:
+                return
+            connection.execute_wrappers.append(self)
+            self._connections.append(connection)
+
+    @contextmanager
+    def installed(self):
+        self._install(connection=connections[DEFAULT_DB_ALIAS])
+        connection_created.connect(self._install)
+        try:
+            yield self
+        finally:
+            connection_created.disconnect(self._install)
+            with self._lock:
+                wrapped, self._connections = self._connections, []
+                for db_connection in wrapped:
+                    if self in db_connection.execute_wrappers:
+                        db_connection.execute_wrappers.remove(self)
+
+
+class DBTimer(ExecuteWrapper):
+    """
+    Суммарное время SQL-запросов во всех соединениях (в том числе
+    открытых рабочими потоками) за время блока timing()
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            with self._lock:
+                self.seconds += time.perf_counter() - started
+
+    def timing(self):
+        return self.installed()
+
+
+def _cache_key(series, labels):
+    label_text = ",".join(f"{name}={value}" for name, value in labels)
+    return f"{METRICS_KEY_PREFIX}:{series}:{label_text}"
+
+
+def flush():
+    """
+    Складывает накопленные в процессе значения в общий кеш
+    """
+    global _flushed_at
+    with _lock:
+        pending, gauges = dict(_pending), dict(_gauges)
+        _pending.clear()
+        _gauges.clear()
+        _flushed_at = time.monotonic()
+    if not pending and not gauges:
+        return
+    keys = {}
+    for (series, labels), amount in pending.items():
+        key = _cache_key(series, labels)
+        keys[key] = (series, labels)
+        cache.add(key, 0, timeout=None)
+        cache.incr(key, amount)
+    for (name, labels), value in gauges.items():
+        key = _cache_key(name, labels)
+        keys[key] = (name, labels)
+        cache.set(key, value, timeout=None)
+    index = cache.get(METRICS_INDEX_KEY) or {}
+    if not keys.keys() <= index.keys():
+        index.update(keys)
+        cache.set(METRICS_INDEX_KEY, index, timeout=None)
+
+
+def record_attempts(attempts):
+    """
+    Учитывает попытки отправки по результату
+    """
+    for attempt in attempts:
+        ATTEMPTS.inc(result=ATTEMPT_RESULTS.get(attempt.status, attempt.status))
+
+
+def record_job(job):
+    """
+    Учитывает результат обработки задания исходящей очереди.
+    Отправленное задание с недоставленными пачками учитывается как partial
+    """
+    if job.status == "Отправлено" and job.last_error:
+        JOBS.inc(result="partial")
+    else:
+        JOBS.inc(result=JOB_RESULTS.get(job.status, job.status))
+
+
+def flush_if_due():
+    """
+    Сбрасывает значения в кеш не чаще раза в METRICS_FLUSH_INTERVAL секунд
+    """
+    if time.monotonic() - _flushed_at >= settings.METRICS_FLUSH_INTERVAL:
+        flush()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+def render():
+    """
+    Метрики всех процессов в текстовом формате Prometheus
+    """
+    flush()
+    index = cache.get(METRICS_INDEX_KEY) or {}
+    values = cache.get_many(list(index))
+    series = {}
+    for key, (name, labels) in index.items():
+        if key in values:
+            series.setdefault(name, []).append((labels, values[key]))
+
+    lines = []
+    for metric in _registry.values():
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        if isinstance(metric, Histogram):
+            lines.extend(_render_histogram(metric, series))
+            continue
+        name = f"{metric.name}_total" if isinstance(metric, Counter) else metric.name
+        for labels, value in sorted(series.get(name, [])):
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def _render_histogram(metric, series):
+    """
+    Строки гистограммы: накопительные корзины, сумма и количество
+    """
+    lines = []
+    bounds = [str(bound) for bound in metric.buckets] + ["+Inf"]
+    groups = {}
+    for labels, value in series.get(f"{metric.name}_bucket", []):
+        labels = dict(labels)
+        le = labels.pop("le")
+        groups.setdefault(tuple(sorted(labels.items())), {})[le] = value
+    sums = dict(series.get(f"{metric.name}_sum", []))
+    counts = dict(series.get(f"{metric.name}_count", []))
+    for labels, buckets in sorted(groups.items()):
+        total = 0
+        for le in bounds:
+            total += buckets.get(le, 0)
+            bucket_labels = _format_labels(labels + (("le", le),))
+            lines.append(f"{metric.name}_bucket{bucket_labels} {total}")
+        total_sum = sums.get(labels, 0) / metric.scale
+        lines.append(f"{metric.name}_sum{_format_labels(labels)} {total_sum}")
+        lines.append(f"{metric.name}_count{_format_labels(labels)} {counts.get(labels, 0)}")
+    return lines
+
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TICK_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+RECIPIENT_BUCKETS = (1, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+
+SEND_SECONDS = Histogram(
+    "mailing_send_seconds",
+    "Время отправки одной рассылки",
+    SECONDS_BUCKETS,
+    scale=10**6,
+)
+SEND_RECIPIENTS = Histogram(
+    "mailing_send_recipients",
+    "Количество адресатов одной отправки рассылки",
+    RECIPIENT_BUCKETS,
+)
+SMTP_SECONDS = Histogram(
+    "smtp_chunk_seconds",
+    "Время отправки одной пачки адресов на SMTP-сервер",
+    SECONDS_BUCKETS,
+    scale=10**6,
+)
+ATTEMPTS = Counter("mailing_attempts", "Попытки отправки по результату")
+TICK_SECONDS = Histogram(
+    "scheduler_tick_seconds",
+    "Длительность тика планировщика",
+    TICK_BUCKETS,
+    scale=10**6,
+)
+TICK_DB_SECONDS = Histogram(
+    "scheduler_tick_db_seconds",
+    "Время SQL-запросов за тик планировщика",
+    TICK_BUCKETS,
+    scale=10**6,
+)
+DUE_BACKLOG = Gauge(
+    "mailing_due_backlog",
+    "Рассылки, дата отправки которых наступила, в начале тика",
+)
+SCHEDULE_LAG = Gauge(
+    "mailing_schedule_lag_seconds",
+    "Опоздание самой старой наступившей рассылки в начале тика",
+)
+OUTBOX_READY = Gauge("outbox_ready_jobs", "Задания исходящей очереди, готовые к отправке")
+JOBS = Counter("outbox_jobs", "Обработанные задания исходящей очереди по результату")
@@ -0,0 +1,129 @@
+import cProfile
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryProfile:
+    """
+    Запросы к БД одного HTTP-запроса: количество, время и повторы
+    (одинаковый SQL с одинаковыми параметрами)
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+            self.statements[(sql, repr(params))] += 1
+
+    @property
+    def duplicates(self):
+        return self.count - len(self.statements)
+
+    def most_repeated(self, limit=3):
+        """
+        Самые частые повторяющиеся запросы: [(sql, сколько раз)]
+        """
+        return [
+            (sql, times) for (sql, _), times in self.statements.most_common(limit) if times > 1
+        ]
+
+
+def query_budget(view_name):
+    """
+    Допустимое количество запросов к БД для представления (QUERY_BUDGETS по имени URL)
+    """
+    return settings.QUERY_BUDGETS.get(view_name, settings.QUERY_BUDGET_DEFAULT)
+
+
+def server_timing(profile, total_seconds):
+    """
+    Значение заголовка Server-Timing (видно во вкладке Network инструментов браузера)
+    """
+    return ", ".join(
+        (
+            f"total;dur={total_seconds * 1000:.1f}",
+            f'db;dur={profile.seconds * 1000:.1f};desc="{profile.count} queries"',
+            f'dup;desc="{profile.duplicates} duplicate queries"',
+        )
+    )
+
+
+class QueryProfilingMiddleware:
+    """
+    Профилирование запросов к БД по HTTP-запросам (включается QUERY_PROFILING).
+    Добавляет в ответ заголовок Server-Timing с временем ответа, временем
+    и количеством SQL-запросов и числом повторов, пишет в лог представления,
+    превысившие бюджет запросов (QUERY_BUDGETS / QUERY_BUDGET_DEFAULT).
+    Если задан QUERY_PROFILE_DIR, запросы медленнее QUERY_PROFILE_SLOW_MS
+    сохраняются туда дампами cProfile (смотреть python -m pstats или snakeviz).
+    Запросы, выполняемые при чтении потокового ответа, не учитываются
+    """
+
+    def __init__(self, get_response):
+        if not settings.QUERY_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = QueryProfile()
+        profiler = cProfile.Profile() if settings.QUERY_PROFILE_DIR else None
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(profile))
+            if profiler is not None:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+        total_seconds = time.perf_counter() - started
+
+        match = request.resolver_match
+        view_name = match.view_name if match is not None else request.path
+        response["Server-Timing"] = server_timing(profile, total_seconds)
+        budget = query_budget(view_name)
+        if profile.count > budget:
+            logger.warning(
+                "%s (%s): %s запросов к БД при бюджете %s, повторов %s, время БД %.1f мс%s",
+                view_name,
+                request.path,
+                profile.count,
+                budget,
+                profile.duplicates,
+                profile.seconds * 1000,
+                "".join(f"\n  {times}x {sql}" for sql, times in profile.most_repeated()),
+            )
+        if profiler is not None and total_seconds * 1000 >= settings.QUERY_PROFILE_SLOW_MS:
+            self.dump(profiler, view_name, total_seconds)
+        return response
+
+    def dump(self, profiler, view_name, total_seconds):
+        """
+        Сохраняет дамп cProfile медленного запроса
+        """
+        directory = Path(settings.QUERY_PROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        name = view_name.replace(":", "-").strip("/").replace("/", "-") or "root"
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = directory / f"{name}-{stamp}-{total_seconds * 1000:.0f}ms.prof"
+        profiler.dump_stats(path)
+        logger.info("Профиль медленного запроса %s сохранен в %s", view_name, path)
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.16 on 2026-10-18 15:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('message', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mailinglist',
+            index=models.Index(fields=['status', 'next_date'], name='mailing_status_next_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mailinglist',
+            index=models.Index(condition=models.Q(('status', 'Запущена')), fields=['next_date'], name='mailing_due_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.16 on 2026-10-18 15:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('message', '0002_mailinglist_due_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('В очереди', 'В очереди'), ('Отправлено', 'Отправлено'), ('Не доставлено', 'Не доставлено')], default='В очереди', max_length=50, verbose_name='Статус задания')),
+                ('attempts_count', models.PositiveIntegerField(default=0, verbose_name='Количество попыток')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата и время следующей попытки')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='Занято обработчиком до')),
+                ('last_error', models.TextField(blank=True, null=True, verbose_name='Последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата и время постановки в очередь')),
+                ('mailing_list', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='delivery_jobs', to='message.mailinglist', verbose_name='Рассылка')),
+            ],
+            options={
+                'verbose_name': 'Задание на отправку',
+                'verbose_name_plural': 'Задания на отправку',
+                'ordering': ('id',),
+                'indexes': [models.Index(condition=models.Q(('status', 'В очереди')), fields=['available_at'], name='delivery_job_ready_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-18 15:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('message', '0004_deliveryjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attempt',
+            index=models.Index(fields=['mailing_list', 'date_time_last_attempt', 'id'], name='attempt_mailing_time_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.16 on 2026-10-18 15:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('message', '0005_attempt_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MailingStats',
+            fields=[
+                ('mailing_list', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='message.mailinglist', verbose_name='Рассылка')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Всего попыток')),
+                ('successful', models.PositiveIntegerField(default=0, verbose_name='Успешных попыток')),
+                ('failed', models.PositiveIntegerField(default=0, verbose_name='Неуспешных попыток')),
+                ('last_attempt_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата и время последней попытки')),
+                ('last_error', models.TextField(blank=True, null=True, verbose_name='Последняя ошибка')),
+            ],
+            options={
+                'verbose_name': 'Статистика рассылки',
+                'verbose_name_plural': 'Статистика рассылок',
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.16 on 2026-10-18 15:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('message', '0006_mailingstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Дата и время изменения'),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-18 15:52
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('message', '0007_message_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='client_email_lower_idx'),
+        ),
+    ]
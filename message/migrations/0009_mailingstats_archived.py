@@ -0,0 +1,23 @@
+# Generated by Django 4.2.16 on 2026-10-18 16:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('message', '0008_client_email_lower_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailingstats',
+            name='archived_successful',
+            field=models.PositiveIntegerField(default=0, verbose_name='Успешных попыток в архиве'),
+        ),
+        migrations.AddField(
+            model_name='mailingstats',
+            name='archived_total',
+            field=models.PositiveIntegerField(default=0, verbose_name='Попыток в архиве'),
+        ),
+    ]
@@ -0,0 +1,121 @@
+from django.conf import settings
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.http import Http404, JsonResponse
+
+from message.owner_cache import ALL_OWNERS, get_or_build
+from message.pagination import KeysetPaginator
+
+
+class OwnedObjectMixin:
+    """
+    Объект страницы (сообщение, клиент, рассылка) загружается вместе с владельцем
+    один раз за запрос: проверка прав и сама страница используют один и тот же
+    экземпляр, а не выполняют get_object() каждая своим запросом
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().select_related("owner")
+
+    def get_object(self, queryset=None):
+        """
+        Объект из кеша запроса (если queryset не передан явно)
+        """
+        if queryset is not None:
+            return super().get_object(queryset)
+        if not hasattr(self, "_owned_object"):
+            self._owned_object = super().get_object()
+        return self._owned_object
+
+    def is_owner(self):
+        """
+        Является ли текущий пользователь владельцем объекта (или суперпользователем).
+        Сравниваются id, поэтому владелец не загружается отдельным запросом
+        """
+        user = self.request.user
+        return user.is_superuser or self.get_object().owner_id == user.pk
+
+
+class OwnerRequiredMixin(LoginRequiredMixin, UserPassesTestMixin, OwnedObjectMixin):
+    """
+    Доступ к странице объекта только владельцу и суперпользователю
+    """
+
+    def test_func(self):
+        return self.is_owner()
+
+
+class KeysetListMixin:
+    """
+    Постраничный список с keyset-пагинацией (KeysetPaginator) для ListView.
+    GET-параметры: per_page - размер страницы (не больше LIST_MAX_PAGE_SIZE),
+    after/before - курсоры соседних страниц, format=json - страница в JSON
+    """
+    keyset_ordering = ("id",)
+    page_sizes = (12, 24, 48, 96)
+
+    def cache_scope(self):
+        """
+        Чьи данные показывает список (для кеша владельца): id пользователя,
+        ALL_OWNERS для суперпользователя или None - не кешировать
+        """
+        user = self.request.user
+        if not user.is_authenticated:
+            return None
+        return ALL_OWNERS if user.is_superuser else user.pk
+
+    def get_per_page(self):
+        """
+        Размер страницы из GET-параметра per_page или LIST_PAGE_SIZE
+        """
+        try:
+            per_page = int(self.request.GET.get("per_page", settings.LIST_PAGE_SIZE))
+        except ValueError:
+            per_page = settings.LIST_PAGE_SIZE
+        return min(max(per_page, 1), settings.LIST_MAX_PAGE_SIZE)
+
+    def get_context_data(self, **kwargs):
+        """
+        Вместо всего списка в контекст попадает одна страница.
+        Страница берется из кеша владельца (message.owner_cache)
+        """
+        per_page = self.get_per_page()
+        after, before = self.request.GET.get("after"), self.request.GET.get("before")
+        paginator = KeysetPaginator(self.object_list, self.keyset_ordering, per_page)
+        try:
+            page = get_or_build(
+                self.cache_scope(),
+                type(self).__name__,
+                (per_page, after, before),
+                lambda: paginator.page(after=after, before=before),
+            )
+        except ValueError:
+            raise Http404
+        return super().get_context_data(
+            object_list=page.object_list,
+            page=page,
+            per_page=per_page,
+            page_sizes=self.page_sizes,
+            **kwargs,
+        )
+
+    def json_row(self, obj):
+        """
+        Объект страницы для ответа в JSON
+        """
+        return {"id": obj.pk}
+
+    def render_to_response(self, context, **response_kwargs):
+        """
+        Страница в JSON для format=json, иначе HTML
+        """
+        if self.request.GET.get("format") != "json":
+            return super().render_to_response(context, **response_kwargs)
+        page = context["page"]
+        return JsonResponse(
+            {
+                "results": [self.json_row(obj) for obj in page.object_list],
+                "next": page.next_cursor,
+                "previous": page.previous_cursor,
+                "per_page": context["per_page"],
+            }
+        )
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Lower
 from django.utils import timezone
 
 from users.models import User
@@ -17,6 +18,10 @@ class Message(models.Model):
         blank=True,
         null=True,
     )
+    updated_at = models.DateTimeField(
+        verbose_name="Дата и время изменения",
+        auto_now=True,
+    )
 
     class Meta:
         verbose_name = "Сообщение"
@@ -48,6 +53,10 @@ class Client(models.Model):
         verbose_name = "Клиент"
         verbose_name_plural = "Клиенты"
         ordering = ("id",)
+        indexes = [
+            # Поиск уже существующих адресов без учета регистра при импорте
+            models.Index(Lower("email"), name="client_email_lower_idx"),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.email})"
@@ -115,6 +124,14 @@ class MailingList(models.Model):
             ("can_edit_status", "can_edit_status"),
         ]
         ordering = ("id",)
+        indexes = [
+            models.Index(fields=["status", "next_date"], name="mailing_status_next_date_idx"),
+            models.Index(
+                fields=["next_date"],
+                name="mailing_due_idx",
+                condition=models.Q(status="Запущена"),
+            ),
+        ]
 
     def __str__(self):
         return f'Рассылка "{self.message}"'
@@ -154,6 +171,112 @@ class Attempt(models.Model):
         verbose_name = "Попытка"
         verbose_name_plural = "Попытки"
         ordering = ("id",)
+        indexes = [
+            models.Index(
+                fields=["mailing_list", "date_time_last_attempt", "id"],
+                name="attempt_mailing_time_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"Попытка отправки письма N {self.pk}"
+
+
+class MailingStats(models.Model):
+    """
+    Сводная статистика попыток отправки рассылки.
+    Обновляется вместе с записью попыток, чтобы не агрегировать Attempt на каждый запрос.
+    Счетчики включают попытки, перенесенные в архив; archived_* хранят их долю,
+    чтобы пересчет по оставшимся в БД попыткам не терял архивные
+    """
+    mailing_list = models.OneToOneField(
+        MailingList,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name="Рассылка",
+        related_name="stats",
+    )
+    total = models.PositiveIntegerField(verbose_name="Всего попыток", default=0)
+    successful = models.PositiveIntegerField(verbose_name="Успешных попыток", default=0)
+    failed = models.PositiveIntegerField(verbose_name="Неуспешных попыток", default=0)
+    last_attempt_at = models.DateTimeField(
+        verbose_name="Дата и время последней попытки",
+        blank=True,
+        null=True,
+    )
+    last_error = models.TextField(
+        verbose_name="Последняя ошибка",
+        blank=True,
+        null=True,
+    )
+    archived_total = models.PositiveIntegerField(verbose_name="Попыток в архиве", default=0)
+    archived_successful = models.PositiveIntegerField(
+        verbose_name="Успешных попыток в архиве", default=0
+    )
+
+    class Meta:
+        verbose_name = "Статистика рассылки"
+        verbose_name_plural = "Статистика рассылок"
+
+    def __str__(self):
+        return f"Статистика {self.mailing_list_id}: {self.successful}/{self.total}"
+
+
+class DeliveryJob(models.Model):
+    """
+    Задание на отправку рассылки в исходящей очереди (outbox)
+    """
+    STATUS_CHOICES = [
+        ("В очереди", "В очереди"),
+        ("Отправлено", "Отправлено"),
+        ("Не доставлено", "Не доставлено"),
+    ]
+    mailing_list = models.ForeignKey(
+        MailingList,
+        on_delete=models.CASCADE,
+        verbose_name="Рассылка",
+        related_name="delivery_jobs",
+    )
+    status = models.CharField(
+        max_length=50,
+        choices=STATUS_CHOICES,
+        verbose_name="Статус задания",
+        default="В очереди",
+    )
+    attempts_count = models.PositiveIntegerField(
+        verbose_name="Количество попыток",
+        default=0,
+    )
+    available_at = models.DateTimeField(
+        verbose_name="Дата и время следующей попытки",
+        default=timezone.now,
+    )
+    locked_until = models.DateTimeField(
+        verbose_name="Занято обработчиком до",
+        null=True,
+        blank=True,
+    )
+    last_error = models.TextField(
+        verbose_name="Последняя ошибка",
+        blank=True,
+        null=True,
+    )
+    created_at = models.DateTimeField(
+        verbose_name="Дата и время постановки в очередь",
+        auto_now_add=True,
+    )
+
+    class Meta:
+        verbose_name = "Задание на отправку"
+        verbose_name_plural = "Задания на отправку"
+        ordering = ("id",)
+        indexes = [
+            models.Index(
+                fields=["available_at"],
+                name="delivery_job_ready_idx",
+                condition=models.Q(status="В очереди"),
+            ),
+        ]
+
+    def __str__(self):
+        return f"Задание на отправку N {self.pk}"
@@ -0,0 +1,158 @@
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch, Q
+from django.utils import timezone
+
+from message.models import Client, DeliveryJob, MailingList
+from message.owner_cache import bump_owner_version
+from message.personalization import MERGE_FIELDS
+from message.scheduling import due_mailings, plan_next_date
+
+
+def enqueue_due_mailings(batch_size=None, now=None):
+    """
+    Ставит в исходящую очередь задания для рассылок, у которых подошла дата отправки.
+    Рассылки блокируются пачками через SELECT ... FOR UPDATE SKIP LOCKED, задания
+    создаются и next_date пересчитывается (plan_next_date) в той же транзакции,
+    поэтому планировщик можно запускать на нескольких узлах без повторных отправок.
+    Пачки выбираются по возрастанию id после последней обработанной рассылки:
+    рассылка, которой политика replay оставила next_date в прошлом, за один тик
+    получает не больше одного задания. Возвращает число заданий
+    """
+    batch_size = batch_size or settings.DISPATCH_CLAIM_BATCH_SIZE
+    now = now or timezone.now()
+    last_pk = 0
+    enqueued = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                due_mailings(now)
+                .filter(pk__gt=last_pk)
+                .select_related("owner")
+                .select_for_update(skip_locked=True, of=("self",))
+                .order_by("pk")[:batch_size]
+            )
+            if not batch:
+                break
+            jobs = []
+            for mailing in batch:
+                send, mailing.next_date = plan_next_date(mailing, now)
+                if send:
+                    jobs.append(DeliveryJob(mailing_list=mailing, available_at=now))
+            DeliveryJob.objects.bulk_create(jobs)
+            MailingList.objects.bulk_update(batch, ["next_date"])
+        bump_owner_version(*{mailing.owner_id for mailing in batch})
+        last_pk = batch[-1].pk
+        enqueued += len(jobs)
+        if len(batch) < batch_size:
+            break
+    return enqueued
+
+
+def ready_jobs(now=None):
+    """
+    Задания, которые пора отправлять и которые не заняты другим обработчиком
+    """
+    now = now or timezone.now()
+    return DeliveryJob.objects.filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lt=now),
+        status="В очереди",
+        available_at__lte=now,
+    )
+
+
+def claim_jobs(batch_size=None, now=None):
+    """
+    Захватывает пачку заданий для текущего обработчика.
+    Строки блокируются через SELECT ... FOR UPDATE SKIP LOCKED, и на них ставится
+    аренда locked_until; если обработчик упал, аренда истекает через
+    DISPATCH_LEASE_SECONDS и задание достанется другому
+    """
+    batch_size = batch_size or settings.DISPATCH_CLAIM_BATCH_SIZE
+    now = now or timezone.now()
+    with transaction.atomic():
+        pks = list(
+            ready_jobs(now)
+            .select_for_update(skip_locked=True)
+            .order_by("available_at")
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        if not pks:
+            return []
+        locked_until = now + timedelta(seconds=settings.DISPATCH_LEASE_SECONDS)
+        DeliveryJob.objects.filter(pk__in=pks).update(locked_until=locked_until)
+    jobs = DeliveryJob.objects.filter(pk__in=pks).select_related("mailing_list__message")
+    if settings.MAILING_PREFETCH_CLIENTS:
+        jobs = jobs.prefetch_related(
+            Prefetch(
+                "mailing_list__clients",
+                queryset=Client.objects.only("id", *MERGE_FIELDS).order_by("pk"),
+            )
+        )
+    return list(jobs)
+
+
+def backoff_delay(attempts_count):
+    """
+    Экспоненциальная задержка перед повтором со случайным разбросом (jitter),
+    чтобы повторы разных заданий не приходили на сервер одновременно
+    """
+    backoff = min(
+        settings.OUTBOX_BACKOFF_MAX,
+        settings.OUTBOX_BACKOFF_BASE * 2 ** (attempts_count - 1),
+    )
+    return timedelta(seconds=random.uniform(backoff / 2, backoff))
+
+
+def finish_job(job: DeliveryJob, error=None, partial_error=None):
+    """
+    Отмечает результат попытки: успех, повтор с задержкой
+    или перевод в "Не доставлено" после OUTBOX_MAX_ATTEMPTS неудач (без сохранения в БД).
+    При успехе в last_error остаются ответы недоставленных пачек (partial_error)
+    """
+    job.attempts_count += 1
+    job.locked_until = None
+    job.last_error = error if error is not None else partial_error
+    if error is None:
+        job.status = "Отправлено"
+    elif job.attempts_count >= settings.OUTBOX_MAX_ATTEMPTS:
+        job.status = "Не доставлено"
+    else:
+        job.available_at = timezone.now() + backoff_delay(job.attempts_count)
+    return job
+
+
+def release_job(job: DeliveryJob):
+    """
+    Возвращает не начатое задание в очередь без учета попытки
+    """
+    job.locked_until = None
+    return job
+
+
+def delivery_error(attempts):
+    """
+    Текст ошибки, если ни одна пачка рассылки не была доставлена, иначе None.
+    Задание повторяется только в этом случае (см. partial_delivery_error)
+    """
+    if any(attempt.status == "Успешно" for attempt in attempts):
+        return None
+    return "; ".join(attempt.mail_server_response or "" for attempt in attempts)
+
+
+def partial_delivery_error(attempts):
+    """
+    Ответы недоставленных пачек, если остальные пачки доставлены, иначе None.
+    Такие пачки не повторяются: задание считается отправленным, потому что повтор
+    разослал бы письмо уже получившим его адресатам второй раз. Частичная доставка
+    видна в last_error задания и в метрике outbox_jobs{result="partial"}
+    """
+    if delivery_error(attempts) is not None:
+        return None
+    failed = [
+        attempt.mail_server_response or "" for attempt in attempts if attempt.status != "Успешно"
+    ]
+    return "; ".join(failed) or None
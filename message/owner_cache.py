@@ -0,0 +1,83 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+OWNER_CACHE_EPOCH_KEY = "owner_cache:epoch"
+ALL_OWNERS = "all"
+
+
+def _version_key(scope):
+    return f"owner_cache:version:{scope}"
+
+
+def _versions(keys):
+    """
+    Текущие версии по ключам. Отсутствующая версия создается из текущего
+    времени в наносекундах, поэтому после вытеснения ключа версии из кеша
+    старые записи не оживают
+    """
+    values = cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        for key in missing:
+            cache.add(key, time.time_ns(), timeout=None)
+        values.update(cache.get_many(missing))
+    return values
+
+
+def owner_version(scope):
+    """
+    Версия данных владельца (scope - id пользователя или ALL_OWNERS
+    для страниц со всеми объектами) вместе с общей эпохой кеша
+    """
+    scope_key = _version_key(scope)
+    values = _versions([OWNER_CACHE_EPOCH_KEY, scope_key])
+    return f"{values[OWNER_CACHE_EPOCH_KEY]}.{values[scope_key]}"
+
+
+def _incr(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Версии нет в кеше - при следующем чтении будет создана новая
+        pass
+
+
+def bump_owner_version(*owner_ids):
+    """
+    Делает устаревшими закешированные данные владельцев и страниц со всеми
+    объектами: увеличивается счетчик версии, ключи записей не перебираются
+    """
+    if not settings.CACHE_ENABLED:
+        return
+    scopes = {owner_id for owner_id in owner_ids if owner_id is not None}
+    for scope in scopes | {ALL_OWNERS}:
+        _incr(_version_key(scope))
+
+
+def bump_all_owners():
+    """
+    Делает устаревшим кеш всех владельцев (после массовых изменений)
+    """
+    if settings.CACHE_ENABLED:
+        _incr(OWNER_CACHE_EPOCH_KEY)
+
+
+def get_or_build(scope, name, parts, build):
+    """
+    Значение из кеша владельца или build(). Ключ строится из scope, его версии,
+    имени и параметров (parts), поэтому после bump_owner_version старые записи
+    просто не читаются и истекают через OWNER_CACHE_TIMEOUT.
+    Если scope равен None (анонимный пользователь), кеш не используется
+    """
+    if not settings.CACHE_ENABLED or scope is None:
+        return build()
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    key = f"owner_cache:{scope}:{owner_version(scope)}:{name}:{digest}"
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        cache.set(key, value, settings.OWNER_CACHE_TIMEOUT)
+    return value
@@ -0,0 +1,115 @@
+import base64
+import json
+from dataclasses import dataclass
+
+from django.db.models import Q
+
+
+@dataclass
+class KeysetPage:
+    """
+    Страница keyset-пагинации: строки с номерами и курсоры соседних страниц
+    """
+    object_list: list
+    start_number: int
+    next_cursor: str = None
+    previous_cursor: str = None
+
+    @property
+    def rows(self):
+        """
+        Пары (номер строки, объект)
+        """
+        return list(enumerate(self.object_list, start=self.start_number))
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class KeysetPaginator:
+    """
+    Пагинация по курсору (keyset) вместо OFFSET: следующая страница выбирается
+    условием (поля сортировки) > (значения последней строки), поэтому стоимость
+    запроса не растет с номером страницы, если сортировка покрыта индексом.
+    Курсор хранит значения полей сортировки и номер строки, так что номера
+    строк вычисляются без COUNT.
+
+        page = KeysetPaginator(queryset, ("date_time_last_attempt", "id"), 50).page(
+            after=request.GET.get("after"), before=request.GET.get("before")
+        )
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self._fields = [queryset.model._meta.get_field(name) for name in self.ordering]
+
+    def encode_cursor(self, obj, number):
+        """
+        Курсор строки: значения полей сортировки и номер строки
+        """
+        values = [field.value_to_string(obj) for field in self._fields]
+        data = json.dumps(values + [number], separators=(",", ":"))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, cursor):
+        """
+        Значения полей сортировки и номер строки из курсора.
+        Для некорректного курсора выбрасывает ValueError
+        """
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            *values, number = json.loads(base64.urlsafe_b64decode(padded))
+            values = [field.to_python(value) for field, value in zip(self._fields, values)]
+        except Exception as error:
+            raise ValueError(f"Некорректный курсор: {cursor}") from error
+        if len(values) != len(self._fields) or not isinstance(number, int):
+            raise ValueError(f"Некорректный курсор: {cursor}")
+        return values, number
+
+    def _after(self, values, lookup):
+        """
+        Условие (поля сортировки) > values (или < для lookup="lt")
+        """
+        condition = Q()
+        for position, name in enumerate(self.ordering):
+            equal = {self.ordering[i]: values[i] for i in range(position)}
+            condition |= Q(**equal, **{f"{name}__{lookup}": values[position]})
+        return condition
+
+    def page(self, after=None, before=None):
+        """
+        Страница после курсора after, перед курсором before или первая страница
+        """
+        if before:
+            values, number = self.decode_cursor(before)
+            descending = [f"-{name}" for name in self.ordering]
+            rows = list(
+                self.queryset.filter(self._after(values, "lt"))
+                .order_by(*descending)[: self.per_page + 1]
+            )
+            has_previous = len(rows) > self.per_page
+            rows = rows[: self.per_page][::-1]
+            start_number, has_next = number - len(rows), True
+        else:
+            start_number, has_previous = 1, False
+            queryset = self.queryset
+            if after:
+                values, number = self.decode_cursor(after)
+                queryset = queryset.filter(self._after(values, "gt"))
+                start_number, has_previous = number + 1, True
+            rows = list(queryset.order_by(*self.ordering)[: self.per_page + 1])
+            has_next = len(rows) > self.per_page
+            rows = rows[: self.per_page]
+        page = KeysetPage(rows, start_number)
+        if rows and has_next:
+            page.next_cursor = self.encode_cursor(rows[-1], start_number + len(rows) - 1)
+        if rows and has_previous:
+            page.previous_cursor = self.encode_cursor(rows[0], start_number)
+        return page
@@ -0,0 +1,79 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.template import Context, Engine
+
+from message.models import Message
+
+# Поля клиента, доступные в тексте сообщения: {{ name }}, {{ email }}, {{ comment }}
+MERGE_FIELDS = ("name", "email", "comment")
+
+_engine = Engine(autoescape=False)
+_compiled = OrderedDict()
+_lock = threading.Lock()
+
+
+def is_personalized(text):
+    """
+    Есть ли в тексте поля подстановки или теги шаблона
+    """
+    return bool(text) and ("{{" in text or "{%" in text)
+
+
+def compile_text(text):
+    """
+    Разбирает текст сообщения в шаблон (TemplateSyntaxError при ошибке в шаблоне)
+    """
+    return _engine.from_string(text or "")
+
+
+def compiled_body(message: Message):
+    """
+    Скомпилированный шаблон текста сообщения.
+    Шаблон разбирается один раз и хранится в памяти процесса по ключу
+    (id сообщения, updated_at), поэтому после изменения сообщения старый шаблон
+    не используется. Хранится не больше PERSONALIZATION_CACHE_SIZE шаблонов
+    """
+    if message.pk is None:
+        return compile_text(message.body_letter)
+    key = (message.pk, message.updated_at)
+    with _lock:
+        template = _compiled.get(key)
+        if template is not None:
+            _compiled.move_to_end(key)
+            return template
+    template = compile_text(message.body_letter)
+    with _lock:
+        _compiled[key] = template
+        while len(_compiled) > settings.PERSONALIZATION_CACHE_SIZE:
+            _compiled.popitem(last=False)
+    return template
+
+
+def render_bodies(message: Message, rows):
+    """
+    Тексты писем для пачки клиентов (словари с полями MERGE_FIELDS).
+    Шаблон и контекст создаются один раз на пачку, для каждого клиента
+    в контекст только добавляются его поля
+    """
+    template = compiled_body(message)
+    context = Context(autoescape=False)
+    bodies = []
+    for row in rows:
+        with context.push(**{field: row.get(field) or "" for field in MERGE_FIELDS}):
+            bodies.append(template.render(context))
+    return bodies
+
+
+def personalized_emails(message: Message, rows, from_email, connection=None):
+    """
+    Персональные письма для пачки клиентов
+    """
+    return [
+        EmailMessage(
+            message.title_letter, body, from_email, [row["email"]], connection=connection
+        )
+        for row, body in zip(rows, render_bodies(message, rows))
+    ]
@@ -0,0 +1,74 @@
+import threading
+
+from django.conf import settings
+from django.db import transaction
+
+from message.models import Attempt, DeliveryJob
+from message.owner_cache import bump_owner_version
+from message.stats import update_mailing_stats
+
+JOB_FIELDS = ["status", "attempts_count", "available_at", "locked_until", "last_error"]
+
+
+class AttemptRecorder:
+    """
+    Буфер попыток отправки и результатов заданий исходящей очереди.
+    Накопленные записи сбрасываются в БД через bulk_create/bulk_update
+    пачками по ATTEMPT_BATCH_SIZE, а не отдельным запросом на каждую отправку.
+    С autoflush=False буфер сам не сбрасывается (для цикла событий asyncio,
+    где ORM можно вызывать только через sync_to_async) - нужно вызвать flush().
+
+        with AttemptRecorder() as recorder:
+            recorder.add_attempts(attempts)
+            recorder.save_job(job)
+    """
+
+    def __init__(self, batch_size=None, autoflush=True):
+        self.batch_size = batch_size or settings.ATTEMPT_BATCH_SIZE
+        self.autoflush = autoflush
+        self._attempts = []
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def add_attempts(self, attempts):
+        """
+        Добавляет несохраненные попытки в буфер
+        """
+        with self._lock:
+            self._attempts.extend(attempts)
+            full = len(self._attempts) >= self.batch_size
+        if full and self.autoflush:
+            self.flush()
+
+    def save_job(self, job: DeliveryJob):
+        """
+        Запоминает измененное задание исходящей очереди
+        """
+        with self._lock:
+            self._jobs[job.pk] = job
+            full = len(self._jobs) >= self.batch_size
+        if full and self.autoflush:
+            self.flush()
+
+    def flush(self):
+        """
+        Записывает накопленные попытки, статистику рассылок и задания в БД
+        одной транзакцией
+        """
+        with self._lock:
+            attempts, self._attempts = self._attempts, []
+            jobs, self._jobs = list(self._jobs.values()), {}
+        if not attempts and not jobs:
+            return
+        with transaction.atomic():
+            Attempt.objects.bulk_create(attempts, batch_size=self.batch_size)
+            update_mailing_stats(attempts)
+            DeliveryJob.objects.bulk_update(jobs, JOB_FIELDS, batch_size=self.batch_size)
+        # bulk_create не отправляет сигналы: статистика рассылок в кеше владельцев устарела
+        bump_owner_version(*{attempt.mailing_list.owner_id for attempt in attempts})
@@ -0,0 +1,114 @@
+import os
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from message.exporting import iter_buffered, iter_gzip, iter_jsonl, iter_rows
+from message.models import Attempt
+from message.scheduling import add_months
+from message.stats import add_archived_stats
+
+
+def month_start(value):
+    """
+    Начало месяца даты в текущем часовом поясе
+    """
+    value = timezone.localtime(value)
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def archive_months(cutoff):
+    """
+    Месяцы (начало, конец), все попытки которых старше cutoff
+    """
+    oldest = Attempt.objects.aggregate(oldest=Min("date_time_last_attempt"))["oldest"]
+    if oldest is None:
+        return
+    start = month_start(oldest)
+    while add_months(start, 1) <= cutoff:
+        yield start, add_months(start, 1)
+        start = add_months(start, 1)
+
+
+def archive_path(start):
+    """
+    Файл архива за месяц. Если он уже есть (повторный запуск),
+    берется следующий номер части
+    """
+    directory = Path(settings.ATTEMPT_ARCHIVE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"attempts-{start:%Y-%m}.jsonl.gz"
+    part = 1
+    while path.exists():
+        part += 1
+        path = directory / f"attempts-{start:%Y-%m}.{part}.jsonl.gz"
+    return path
+
+
+def write_archive(attempts, path):
+    """
+    Записывает попытки в gzip JSONL. Файл пишется во временный и переименовывается
+    только после fsync, поэтому неполный архив не может появиться под итоговым именем
+    """
+    temporary = path.with_name(f"{path.name}.tmp")
+    with open(temporary, "wb") as file:
+        file.writelines(iter_gzip(iter_buffered(iter_jsonl(iter_rows(attempts)))))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+def delete_in_batches(attempts, batch_size):
+    """
+    Удаляет попытки пачками по первичному ключу, чтобы не держать
+    долгую блокировку и не раздувать одну транзакцию. В той же транзакции
+    попытки пачки переносятся в архивные итоги статистики (add_archived_stats)
+    """
+    deleted = 0
+    while True:
+        pks = list(attempts.order_by("pk").values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        with transaction.atomic():
+            batch = Attempt.objects.filter(pk__in=pks)
+            add_archived_stats(batch)
+            deleted += batch.delete()[0]
+
+
+def archive_attempts(retention_days=None, delete=True, batch_size=None, dry_run=False):
+    """
+    Политика хранения журнала попыток (аналог отсоединения старых секций таблицы).
+    Попытки за каждый месяц, целиком вышедший за ATTEMPT_RETENTION_DAYS,
+    выгружаются в ATTEMPT_ARCHIVE_DIR/attempts-ГГГГ-ММ.jsonl.gz и удаляются из БД
+    пачками. Граница месяца по id фиксируется до выгрузки, так что удаляются
+    ровно записанные в архив строки. Итоги статистики рассылок (MailingStats)
+    не меняются: удаленные попытки учитываются в ее архивных счетчиках.
+    Возвращает список (файл, количество попыток)
+    """
+    if retention_days is None:
+        retention_days = settings.ATTEMPT_RETENTION_DAYS
+    batch_size = batch_size or settings.ATTEMPT_BATCH_SIZE
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    archived = []
+    for start, end in list(archive_months(cutoff)):
+        month = Attempt.objects.filter(
+            date_time_last_attempt__gte=start, date_time_last_attempt__lt=end
+        )
+        last_pk = month.aggregate(last_pk=Max("pk"))["last_pk"]
+        if last_pk is None:
+            continue
+        month = month.filter(pk__lte=last_pk)
+        count = month.count()
+        if dry_run:
+            archived.append((f"attempts-{start:%Y-%m}.jsonl.gz", count))
+            continue
+        path = archive_path(start)
+        write_archive(month, path)
+        if delete:
+            delete_in_batches(month, batch_size)
+        archived.append((str(path), count))
+    return archived
@@ -0,0 +1,113 @@
+import calendar
+from datetime import timedelta
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+from message.models import MailingList
+
+PERIOD_DAYS = {
+    "Раз в день": 1,
+    "Раз в неделю": 7,
+}
+PERIOD_MONTHS = {
+    "Раз в месяц": 1,
+}
+CATCH_UP_POLICIES = ("skip", "coalesce", "replay")
+
+
+def add_months(value, months):
+    """
+    Сдвигает дату на несколько календарных месяцев.
+    Если в месяце нет такого дня (31 февраля), берется последний день месяца
+    """
+    month_index = value.month - 1 + months
+    year, month = value.year + month_index // 12, month_index % 12 + 1
+    day = min(value.day, calendar.monthrange(year, month)[1])
+    return value.replace(year=year, month=month, day=day)
+
+
+def mailing_time_zone(mailing: MailingList):
+    """
+    Часовой пояс владельца рассылки (или TIME_ZONE проекта)
+    """
+    if mailing.owner_id and mailing.owner.time_zone:
+        return ZoneInfo(mailing.owner.time_zone)
+    return ZoneInfo(settings.TIME_ZONE)
+
+
+def occurrence(anchor, periodicity, number):
+    """
+    Дата number-й отправки рассылки, считая от anchor (локальное время без пояса).
+    Каждая дата считается от anchor, а не от предыдущей, поэтому короткие месяцы
+    не сдвигают день отправки навсегда
+    """
+    if periodicity in PERIOD_MONTHS:
+        return add_months(anchor, PERIOD_MONTHS[periodicity] * number)
+    return anchor + timedelta(days=PERIOD_DAYS[periodicity] * number)
+
+
+def next_occurrence(mailing: MailingList, after):
+    """
+    Первая дата отправки рассылки строго позже after.
+    Номер повторения вычисляется сразу по разнице дат, без перебора пропущенных периодов.
+    Расписание ведется в часовом поясе владельца, поэтому рассылка уходит в одно
+    и то же местное время и при переходе на летнее/зимнее время
+    """
+    zone = mailing_time_zone(mailing)
+    anchor = timezone.localtime(
+        mailing.date_and_time_of_sending or mailing.next_date, zone
+    ).replace(tzinfo=None)
+    target = timezone.localtime(after, zone).replace(tzinfo=None)
+    periodicity = mailing.periodicity
+    if periodicity in PERIOD_MONTHS:
+        months = (target.year - anchor.year) * 12 + target.month - anchor.month
+        number = max(months // PERIOD_MONTHS[periodicity], 0)
+    else:
+        number = max((target - anchor).days // PERIOD_DAYS[periodicity], 0)
+    # Оценка снизу отличается от ответа не больше чем на один шаг
+    while occurrence(anchor, periodicity, number).replace(tzinfo=zone) <= after:
+        number += 1
+    return occurrence(anchor, periodicity, number).replace(tzinfo=zone)
+
+
+def plan_next_date(mailing: MailingList, now=None):
+    """
+    Решает, отправлять ли рассылку в этом тике, и вычисляет новую next_date
+    по политике MAILING_CATCH_UP_POLICY для пропущенных отправок:
+    skip - отправить, только если опоздание не больше MAILING_MISFIRE_GRACE секунд;
+    coalesce - отправить один раз за все пропущенные периоды;
+    replay - отправить каждый пропущенный период, по одному за тик.
+    При skip и coalesce новая next_date всегда в будущем.
+    Возвращает пару (отправлять ли, новая next_date)
+    """
+    now = now or timezone.now()
+    policy = settings.MAILING_CATCH_UP_POLICY
+    if policy not in CATCH_UP_POLICIES:
+        raise ImproperlyConfigured(f"Неизвестная политика MAILING_CATCH_UP_POLICY: {policy}")
+    if policy == "replay":
+        return True, next_occurrence(mailing, mailing.next_date)
+    upcoming = next_occurrence(mailing, now)
+    if policy == "skip":
+        lateness = now - mailing.next_date
+        return lateness <= timedelta(seconds=settings.MAILING_MISFIRE_GRACE), upcoming
+    return True, upcoming
+
+
+def due_mailings(now=None):
+    """
+    Запущенные рассылки, у которых подошла дата отправки.
+    Фильтр по статусу выполняется в БД по частичному индексу mailing_due_idx
+    """
+    return MailingList.objects.filter(
+        status="Запущена", next_date__lte=now or timezone.now()
+    )
+
+
+def prefetched_clients(mailing: MailingList):
+    """
+    Клиенты из prefetch-кеша рассылки или None, если клиенты не подгружены
+    """
+    return getattr(mailing, "_prefetched_objects_cache", {}).get("clients")
@@ -1,79 +1,340 @@
-from datetime import datetime, timedelta
-from smtplib import SMTPException
+import asyncio
+import logging
+import time
+from smtplib import (
+    SMTPException,
+    SMTPRecipientsRefused,
+    SMTPResponseException,
+    SMTPServerDisconnected,
+)
 
 from django.conf import settings
 from django.core.cache import cache
 from django.core.mail import send_mail
+from django.db.models import Count, Min
+from django.utils import timezone
 
 from blog.models import Blog
 from config.settings import EMAIL_HOST_USER
-from message.models import MailingList, Attempt, Client
+from message.assembly import PreparedMessage, raw_smtp, refused_summary
+from message.async_dispatch import drain_outbox_async
+from message.dispatch import DispatchEngine, DispatchReport
+from message.models import MailingList, Attempt, Client, DeliveryJob
+from message.metrics import (
+    DUE_BACKLOG,
+    OUTBOX_READY,
+    SCHEDULE_LAG,
+    SEND_RECIPIENTS,
+    SEND_SECONDS,
+    SMTP_SECONDS,
+    TICK_DB_SECONDS,
+    TICK_SECONDS,
+    DBTimer,
+    record_attempts,
+    record_job,
+)
+from message.metrics import flush as flush_metrics
+from message.outbox import (
+    claim_jobs,
+    delivery_error,
+    enqueue_due_mailings,
+    finish_job,
+    partial_delivery_error,
+    ready_jobs,
+    release_job,
+)
+from message.personalization import MERGE_FIELDS, is_personalized, personalized_emails
+from message.recorder import AttemptRecorder
+from message.scheduling import due_mailings, prefetched_clients
+from message.smtp_pool import get_connection_pool
 
+logger = logging.getLogger(__name__)
 
-def sending_a_message(item: MailingList):
+
+def client_rows(item: MailingList, personalized=False, chunk_size=None):
+    """
+    Адреса клиентов рассылки (для персональных писем - словари с полями MERGE_FIELDS).
+    Если клиенты уже подгружены через prefetch_related, БД не запрашивается,
+    иначе строки читаются из БД потоком
+    """
+    clients = prefetched_clients(item)
+    if clients is not None:
+        if personalized:
+            return (
+                {field: getattr(client, field) for field in MERGE_FIELDS}
+                for client in clients
+            )
+        return (client.email for client in clients)
+    clients = item.clients.order_by("pk")
+    if personalized:
+        clients = clients.values(*MERGE_FIELDS)
+    else:
+        clients = clients.values_list("email", flat=True)
+    return clients.iterator(chunk_size=chunk_size or settings.MAILING_CHUNK_SIZE)
+
+
+def iter_recipient_chunks(item: MailingList, personalized=False, chunk_size=None):
+    """
+    Постранично выбирает клиентов рассылки, не загружая весь список в память
+    """
+    chunk_size = chunk_size or settings.MAILING_CHUNK_SIZE
+    chunk = []
+    for row in client_rows(item, personalized, chunk_size):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def send_personalized(connection, emails):
+    """
+    Отправляет персональные письма пачки по одному: отклоненный сервером адрес
+    не срывает отправку остальным. Разрыв соединения прерывает пачку.
+    Возвращает (число доставленных писем, отклоненные адреса {адрес: (код, ответ)})
+    """
+    delivered, refused = 0, {}
+    for email in emails:
+        try:
+            delivered += connection.send_messages([email])
+        except SMTPRecipientsRefused as error:
+            refused.update(error.recipients)
+        except SMTPResponseException as error:
+            refused.update({address: (error.smtp_code, error.smtp_error) for address in email.to})
+    return delivered, refused
+
+
+def deliver_mailing(item: MailingList):
     """
-    Отправка сообщения клиенту с использованием SMTP
+    Отправка рассылки клиентам пачками по MAILING_CHUNK_SIZE адресов
+    через одно SMTP-соединение из пула. Для каждой пачки создается своя попытка,
+    поэтому ошибочный адрес не срывает отправку остальным клиентам.
+    Если в тексте сообщения есть поля подстановки ({{ name }}),
+    каждому клиенту пачки уходит свое письмо, иначе письмо собирается в MIME
+    один раз (PreparedMessage) и для каждой пачки меняется только заголовок To.
+    Возвращает список несохраненных попыток
     """
+    started = time.perf_counter()
+    attempts = []
+    recipients_count = 0
+    personalized = is_personalized(item.message.body_letter)
+    chunks = iter_recipient_chunks(item, personalized)
+    if not personalized:
+        prepared = PreparedMessage(item.message, EMAIL_HOST_USER)
     try:
-        send_mail(
-            item.message.title_letter,
-            item.message.body_letter,
-            EMAIL_HOST_USER,
-            [x.email for x in item.clients.all()],
-            fail_silently=False,
-        )
-    except SMTPException as message:
-        Attempt.objects.create(mailing_list=item, mail_server_response=f"{message}")
+        with get_connection_pool().connection() as connection:
+            for number, recipients in enumerate(chunks, start=1):
+                refused = {}
+                delivered = True
+                smtp = raw_smtp(connection)
+                recipients_count += len(recipients)
+                chunk_started = time.perf_counter()
+                try:
+                    if personalized:
+                        delivered, refused = send_personalized(
+                            connection,
+                            personalized_emails(item.message, recipients, EMAIL_HOST_USER),
+                        )
+                    elif smtp is not None:
+                        envelope = prepared.envelope(recipients)
+                        refused = smtp.sendmail(
+                            prepared.from_email, envelope, prepared.for_recipients(envelope)
+                        )
+                    else:
+                        send_mail(
+                            item.message.title_letter,
+                            item.message.body_letter,
+                            EMAIL_HOST_USER,
+                            recipients,
+                            fail_silently=False,
+                            connection=connection,
+                        )
+                except Exception as message:
+                    SMTP_SECONDS.observe(time.perf_counter() - chunk_started)
+                    attempts.append(
+                        Attempt(
+                            mailing_list=item,
+                            mail_server_response=f"Пачка {number} ({len(recipients)} адр.): {message}",
+                        )
+                    )
+                    broken = isinstance(message, SMTPServerDisconnected)
+                    if not isinstance(message, SMTPException):
+                        logger.exception("Ошибка при отправке пачки %s рассылки %s", number, item)
+                        broken = True
+                    if broken:
+                        # Транзакция SMTP могла остаться незавершенной - соединение
+                        # открывается заново, а не возвращается в пул как исправное
+                        connection.close()
+                        connection.open()
+                else:
+                    SMTP_SECONDS.observe(time.perf_counter() - chunk_started)
+                    attempts.append(
+                        Attempt(
+                            mailing_list=item,
+                            status="Успешно" if delivered else "Не успешно",
+                            mail_server_response=(
+                                f"Пачка {number} ({len(recipients)} адр.): "
+                                f"{'Доставлено' if delivered else 'Не доставлено'}"
+                                f"{refused_summary(refused)}"
+                            ),
+                        )
+                    )
+    except (SMTPException, OSError) as message:
+        attempts.append(Attempt(mailing_list=item, mail_server_response=f"{message}"))
     else:
-        Attempt.objects.create(
-            mailing_list=item, status="Успешно", mail_server_response="Доставлено"
-        )
+        if not attempts:
+            attempts.append(
+                Attempt(mailing_list=item, mail_server_response="У рассылки нет клиентов")
+            )
+    SEND_SECONDS.observe(time.perf_counter() - started)
+    SEND_RECIPIENTS.observe(recipients_count)
+    record_attempts(attempts)
+    return attempts
 
 
-def periodicity_sending():
+def deliver_job(job: DeliveryJob):
     """
-    Отправка сообщения клиенту каждый день
+    Отправка рассылки по заданию исходящей очереди
     """
-    mailing_list = MailingList.objects.filter(next_date__lte=datetime.now())
-    for mailing in mailing_list:
-        if mailing.status == "Запущена":
-            sending_a_message(mailing)
-            if mailing.periodicity == "Раз в день":
-                mailing.next_date = mailing.next_date + timedelta(days=1)
-            if mailing.periodicity == "Раз в неделю":
-                mailing.next_date = mailing.next_date + timedelta(days=7)
-            if mailing.periodicity == "Раз в месяц":
-                mailing.next_date = mailing.next_date + timedelta(days=30)
-            mailing.save(update_fields=["next_date"])
+    return deliver_mailing(job.mailing_list)
 
 
-def get_total_items_from_cache(key_name: str, model_name):
+def drain_outbox(deadline=None):
     """
-    Получение всех записей из кеша, если в кеше нет, то получение через БД
+    Отправляет задания исходящей очереди, которые пора отправлять.
+    Задания захватываются пачками (claim_jobs) и отправляются параллельно через
+    DispatchEngine или через asyncio, если DISPATCH_EXECUTOR = "asyncio".
+    Неудачные задания повторяются с экспоненциальной задержкой, после
+    OUTBOX_MAX_ATTEMPTS неудач переводятся в статус "Не доставлено".
+    Попытки и состояние заданий пишутся в БД пакетно через AttemptRecorder
     """
-    if settings.CACHE_ENABLED:
-        key = key_name
-        item_list = cache.get(key)
-        if item_list is None:
-            item_list = model_name.objects.all()
-            cache.set(key, item_list)
+    deadline = deadline if deadline is not None else settings.DISPATCH_TICK_DEADLINE
+    if settings.DISPATCH_EXECUTOR == "asyncio":
+        return asyncio.run(drain_outbox_async(deadline))
+
+    report = DispatchReport()
+    deadline_at = time.monotonic() + deadline
+    with AttemptRecorder() as recorder:
+
+        def on_success(job, attempts):
+            recorder.add_attempts(attempts)
+            recorder.save_job(finish_job(job, delivery_error(attempts), partial_delivery_error(attempts)))
+            record_job(job)
+
+        def on_failure(job, error):
+            recorder.save_job(finish_job(job, f"{error}"))
+            record_job(job)
+
+        while time.monotonic() < deadline_at:
+            batch = claim_jobs()
+            if not batch:
+                break
+            engine = DispatchEngine(deadline=deadline_at - time.monotonic())
+            report.merge(
+                engine.run(batch, deliver_job, on_success=on_success, on_failure=on_failure)
+            )
+            # Не начатые до дедлайна задания сразу возвращаются в очередь
+            for job in batch:
+                if job.locked_until is not None:
+                    recorder.save_job(release_job(job))
+    return report
+
+
+def periodicity_sending():
+    """
+    Тик планировщика: ставит в исходящую очередь задания для рассылок,
+    у которых подошла дата отправки, и, если OUTBOX_DRAIN_IN_TICK включен,
+    сразу отправляет очередь. Отдельные обработчики очереди запускаются
+    командой drain_outbox
+    """
+    db_timer = DBTimer()
+    with TICK_SECONDS.time(), db_timer.timing():
+        record_backlog()
+        enqueued = enqueue_due_mailings()
+        report = drain_outbox() if settings.OUTBOX_DRAIN_IN_TICK else None
+    TICK_DB_SECONDS.observe(db_timer.seconds)
+    flush_metrics()
+    if report is None:
+        logger.info("Тик рассылки: в очередь поставлено %s", enqueued)
     else:
-        item_list = model_name.objects.all()
+        logger.info("Тик рассылки: в очередь поставлено %s, %s", enqueued, report)
+    return report
+
+
+def record_backlog(now=None):
+    """
+    Записывает в метрики размер отставания планировщика: сколько рассылок
+    уже пора отправить, насколько опаздывает самая старая из них
+    и сколько заданий очереди ждут отправки
+    """
+    now = now or timezone.now()
+    backlog = due_mailings(now).aggregate(count=Count("pk"), oldest=Min("next_date"))
+    DUE_BACKLOG.set(backlog["count"])
+    lag = (now - backlog["oldest"]).total_seconds() if backlog["oldest"] else 0
+    SCHEDULE_LAG.set(lag)
+    OUTBOX_READY.set(ready_jobs(now).count())
+
 
-    return item_list
+HOME_PAGE_COUNTS_KEY = "home_page_counts"
+HOME_PAGE_BLOGS_KEY = "home_page_blogs"
 
 
-def get_total_mailings_active_from_cache():
+def _get_or_build(key, build):
     """
-    Получение всех активных рассылок, если в кеше нет, то получение через БД
+    Получение значения из кеша, если в кеше нет, то вычисление через БД
+    """
+    if not settings.CACHE_ENABLED:
+        return build()
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        cache.set(key, value, settings.HOME_PAGE_CACHE_TIMEOUT)
+    return value
+
+
+def get_home_page_counts():
+    """
+    Количество рассылок, активных рассылок и клиентов для главной страницы.
+    В кеше хранятся только числа; кеш сбрасывается сигналами при изменении
+    рассылок и клиентов (message.signals)
+    """
+    return _get_or_build(
+        HOME_PAGE_COUNTS_KEY,
+        lambda: {
+            "total_mailings": MailingList.objects.count(),
+            "total_active_mailings": MailingList.objects.filter(status="Запущена").count(),
+            "total_clients": Client.objects.count(),
+        },
+    )
+
+
+def get_home_page_blogs():
+    """
+    Небольшая случайная выборка публикаций блога (HOME_PAGE_BLOG_POOL штук),
+    из которой главная страница показывает три. Кеш сбрасывается при изменении блога
+    """
+    return _get_or_build(
+        HOME_PAGE_BLOGS_KEY,
+        lambda: list(
+            Blog.objects.order_by("?").values("pk", "tittle", "content_article", "images")[
+                : settings.HOME_PAGE_BLOG_POOL
+            ]
+        ),
+    )
+
+
+def invalidate_home_page_counts():
+    """
+    Сбрасывает кеш счетчиков главной страницы
     """
     if settings.CACHE_ENABLED:
-        key = "mailing_active"
-        mailing_active_list = cache.get(key)
-        if mailing_active_list is None:
-            mailing_active_list = MailingList.objects.filter(status="Запущена")
-            cache.set(key, mailing_active_list)
-    else:
-        mailing_active_list = MailingList.objects.filter(status="Запущена")
+        cache.delete(HOME_PAGE_COUNTS_KEY)
+
 
-    return mailing_active_list
\ No newline at end of file
+def invalidate_home_page_blogs():
+    """
+    Сбрасывает кеш публикаций блога на главной странице
+    """
+    if settings.CACHE_ENABLED:
+        cache.delete(HOME_PAGE_BLOGS_KEY)
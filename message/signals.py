@@ -0,0 +1,74 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from blog.models import Blog
+from message.daemon import notify_mailing_changed
+from message.models import Attempt, Client, MailingList, Message
+from message.owner_cache import bump_owner_version
+from message.services import invalidate_home_page_blogs, invalidate_home_page_counts
+
+
+@receiver(post_save, sender=MailingList)
+@receiver(post_delete, sender=MailingList)
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+def reset_home_page_counts(sender, **kwargs):
+    """
+    Сбрасывает счетчики главной страницы при изменении рассылок и клиентов
+    """
+    invalidate_home_page_counts()
+
+
+@receiver(post_save, sender=Blog)
+@receiver(post_delete, sender=Blog)
+def reset_home_page_blogs(sender, **kwargs):
+    """
+    Сбрасывает выборку блогов главной страницы при изменении блога
+    """
+    invalidate_home_page_blogs()
+
+
+@receiver(post_save, sender=MailingList)
+@receiver(post_delete, sender=MailingList)
+def wake_scheduler(sender, instance, **kwargs):
+    """
+    Будит демон планировщика после фиксации изменений рассылки
+    """
+    pk = instance.pk
+    transaction.on_commit(lambda: notify_mailing_changed(pk))
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+@receiver(post_save, sender=MailingList)
+@receiver(post_delete, sender=MailingList)
+def reset_owner_cache(sender, instance, **kwargs):
+    """
+    Сбрасывает кеш страниц владельца объекта после фиксации изменений
+    """
+    owner_id = instance.owner_id
+    transaction.on_commit(lambda: bump_owner_version(owner_id))
+
+
+@receiver(m2m_changed, sender=MailingList.clients.through)
+def reset_owner_cache_clients(sender, instance, action, **kwargs):
+    """
+    Сбрасывает кеш владельца при изменении клиентов рассылки
+    """
+    if action.startswith("post_") and isinstance(instance, MailingList):
+        owner_id = instance.owner_id
+        transaction.on_commit(lambda: bump_owner_version(owner_id))
+
+
+@receiver(post_save, sender=Attempt)
+def reset_owner_cache_attempt(sender, instance, **kwargs):
+    """
+    Сбрасывает кеш владельца рассылки при записи отдельной попытки
+    (пакетная запись через AttemptRecorder сбрасывает кеш сама).
+    На post_delete приемника нет, чтобы удаление попыток оставалось одним DELETE
+    """
+    owner_id = instance.mailing_list.owner_id
+    transaction.on_commit(lambda: bump_owner_version(owner_id))
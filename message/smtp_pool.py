@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from smtplib import SMTPException
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+
+class SMTPConnectionPool:
+    """
+    Пул открытых и авторизованных SMTP-соединений.
+    Соединения переиспользуются между письмами, перед выдачей проверяются командой NOOP
+    и переоткрываются, если сервер их закрыл или они простаивали слишком долго
+    """
+
+    def __init__(self, size=None, max_idle=None, acquire_timeout=None, **backend_kwargs):
+        self.size = size or settings.SMTP_POOL_SIZE
+        self.max_idle = max_idle if max_idle is not None else settings.SMTP_POOL_MAX_IDLE
+        self.acquire_timeout = (
+            acquire_timeout
+            if acquire_timeout is not None
+            else settings.SMTP_POOL_ACQUIRE_TIMEOUT
+        )
+        self.backend_kwargs = backend_kwargs
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.size)
+
+    def _open(self):
+        """
+        Открывает новое соединение с почтовым сервером
+        """
+        backend = get_connection(fail_silently=False, **self.backend_kwargs)
+        backend.open()
+        return backend
+
+    def _is_alive(self, backend, last_used):
+        """
+        Проверяет, что соединение можно использовать повторно
+        """
+        if time.monotonic() - last_used > self.max_idle:
+            return False
+        smtp = getattr(backend, "connection", None)
+        if smtp is None:
+            # Не SMTP-бэкенд (например, locmem в тестах) - проверять нечего
+            return True
+        try:
+            return smtp.noop()[0] == 250
+        except (SMTPException, OSError):
+            return False
+
+    def acquire(self):
+        """
+        Выдает живое соединение из пула или открывает новое
+        """
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise SMTPException("Нет свободных SMTP-соединений в пуле")
+        try:
+            while True:
+                with self._lock:
+                    if not self._idle:
+                        break
+                    backend, last_used = self._idle.pop()
+                if self._is_alive(backend, last_used):
+                    return backend
+                self._discard(backend)
+            return self._open()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, backend, broken=False):
+        """
+        Возвращает соединение в пул; сломанное соединение закрывается
+        """
+        try:
+            if broken:
+                self._discard(backend)
+            else:
+                with self._lock:
+                    self._idle.append((backend, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """
+        Контекстный менеджер для отправки писем через соединение из пула:
+
+            with pool.connection() as connection:
+                send_mail(..., connection=connection)
+        """
+        backend = self.acquire()
+        try:
+            yield backend
+        except (SMTPException, OSError):
+            self.release(backend, broken=True)
+            raise
+        except BaseException:
+            self.release(backend)
+            raise
+        else:
+            self.release(backend)
+
+    def close_all(self):
+        """
+        Закрывает все простаивающие соединения
+        """
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+        for backend, _ in idle:
+            self._discard(backend)
+
+    @staticmethod
+    def _discard(backend):
+        try:
+            backend.close()
+        except Exception:
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_connection_pool():
+    """
+    Общий для процесса пул SMTP-соединений
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = SMTPConnectionPool()
+    return _pool
+
+
+def _reset_after_fork():
+    """
+    Дочерний процесс не должен использовать сокеты родителя
+    """
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,131 @@
+from django.db import transaction
+from django.db.models import Case, Count, F, Max, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from message.models import Attempt, MailingList, MailingStats
+
+STATS_FIELDS = ["total", "successful", "failed", "last_attempt_at", "last_error"]
+
+
+def update_mailing_stats(attempts):
+    """
+    Добавляет сохраненные попытки к статистике их рассылок.
+    Вызывается в транзакции записи попыток; счетчики увеличиваются через F(),
+    поэтому параллельные обработчики не затирают друг друга
+    """
+    totals = {}
+    for attempt in attempts:
+        stats = totals.setdefault(
+            attempt.mailing_list_id,
+            {"total": 0, "successful": 0, "last_attempt_at": None, "last_error": None},
+        )
+        stats["total"] += 1
+        if attempt.status == "Успешно":
+            stats["successful"] += 1
+        else:
+            stats["last_error"] = attempt.mail_server_response
+        last_attempt_at = stats["last_attempt_at"]
+        if last_attempt_at is None or attempt.date_time_last_attempt > last_attempt_at:
+            stats["last_attempt_at"] = attempt.date_time_last_attempt
+    if not totals:
+        return
+    MailingStats.objects.bulk_create(
+        [MailingStats(mailing_list_id=pk) for pk in totals], ignore_conflicts=True
+    )
+    for pk, stats in totals.items():
+        changes = {
+            "total": F("total") + stats["total"],
+            "successful": F("successful") + stats["successful"],
+            "failed": F("failed") + stats["total"] - stats["successful"],
+            "last_attempt_at": Case(
+                When(last_attempt_at__gt=stats["last_attempt_at"], then=F("last_attempt_at")),
+                default=Value(stats["last_attempt_at"]),
+            ),
+        }
+        if stats["last_error"] is not None:
+            changes["last_error"] = stats["last_error"]
+        MailingStats.objects.filter(pk=pk).update(**changes)
+
+
+def add_archived_stats(attempts):
+    """
+    Переносит попытки, которые удаляются из БД после архивации (archive_attempts),
+    в архивные итоги статистики их рассылок. Общие счетчики не меняются
+    """
+    rows = list(
+        attempts.order_by()
+        .values("mailing_list_id")
+        .annotate(total=Count("id"), successful=Count("id", filter=Q(status="Успешно")))
+    )
+    MailingStats.objects.bulk_create(
+        [MailingStats(mailing_list_id=row["mailing_list_id"]) for row in rows],
+        ignore_conflicts=True,
+    )
+    for row in rows:
+        MailingStats.objects.filter(pk=row["mailing_list_id"]).update(
+            archived_total=F("archived_total") + row["total"],
+            archived_successful=F("archived_successful") + row["successful"],
+        )
+
+
+def rebuild_mailing_stats(mailings=None, batch_size=500):
+    """
+    Пересчитывает статистику рассылок по таблице Attempt (для заполнения
+    и исправления расхождений). Попытки, уже перенесенные в архив
+    (archive_attempts), берутся из архивных итогов (archived_total/archived_successful).
+    Возвращает количество рассылок
+    """
+    mailings = mailings if mailings is not None else MailingList.objects.all()
+    pks = list(mailings.order_by("pk").values_list("pk", flat=True))
+    last_error = (
+        Attempt.objects.filter(mailing_list=OuterRef("pk"))
+        .exclude(status="Успешно")
+        .order_by("-date_time_last_attempt", "-id")
+        .values("mail_server_response")[:1]
+    )
+    for start in range(0, len(pks), batch_size):
+        rows = (
+            MailingList.objects.filter(pk__in=pks[start:start + batch_size])
+            .annotate(
+                total=Count("attempts"),
+                successful=Count("attempts", filter=Q(attempts__status="Успешно")),
+                archived_total=Coalesce(Max("stats__archived_total"), 0),
+                archived_successful=Coalesce(Max("stats__archived_successful"), 0),
+                last_attempt_at=Coalesce(
+                    Max("attempts__date_time_last_attempt"), Max("stats__last_attempt_at")
+                ),
+                last_error=Coalesce(Subquery(last_error), Max("stats__last_error")),
+            )
+            .values_list(
+                "pk",
+                "total",
+                "successful",
+                "archived_total",
+                "archived_successful",
+                "last_attempt_at",
+                "last_error",
+            )
+        )
+        stats = [
+            MailingStats(
+                mailing_list_id=pk,
+                total=archived_total + total,
+                successful=archived_successful + successful,
+                failed=archived_total + total - archived_successful - successful,
+                last_attempt_at=last_attempt_at,
+                last_error=error,
+                archived_total=archived_total,
+                archived_successful=archived_successful,
+            )
+            for (
+                pk, total, successful, archived_total, archived_successful, last_attempt_at, error
+            ) in rows
+        ]
+        with transaction.atomic():
+            MailingStats.objects.bulk_create(
+                stats,
+                update_conflicts=True,
+                unique_fields=["mailing_list"],
+                update_fields=STATS_FIELDS,
+            )
+    return len(pks)
@@ -3,9 +3,15 @@ from django import template
 register = template.Library()
 
 
-@register.filter()
-def get_number(items):
+@register.simple_tag(takes_context=True)
+def page_query(context, **params):
     """
-    Нумерация строк в таблице
+    Строка GET-параметров текущего запроса с замененными параметрами страницы.
+    Параметры со значением None удаляются
     """
-    return items.pop(0)
\ No newline at end of file
+    query = context["request"].GET.copy()
+    for name, value in params.items():
+        query.pop(name, None)
+        if value is not None:
+            query[name] = value
+    return f"?{query.urlencode()}"
@@ -1,3 +1,1043 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import socket
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from io import BytesIO
+from unittest import mock
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.mail import EmailMessage
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.db.backends.signals import connection_created
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from benchmark.smtp_sink import SMTPSink
+from message import smtp_pool
+from message.async_dispatch import asending_a_message, drain_outbox_async
+from message.daemon import SchedulerDaemon
+from message.dispatch import DispatchEngine
+from message.exporting import EXPORT_FIELDS, export_attempts, filter_attempts
+from message.importing import import_clients
+from message.metrics import DBTimer
+from message.models import Attempt, Client, DeliveryJob, MailingList, MailingStats, Message
+from message.outbox import (
+    backoff_delay,
+    claim_jobs,
+    delivery_error,
+    enqueue_due_mailings,
+    finish_job,
+    partial_delivery_error,
+)
+from message.owner_cache import ALL_OWNERS, get_or_build, owner_version
+from message.pagination import KeysetPaginator
+from message.recorder import AttemptRecorder
+from message.retention import archive_attempts, write_archive
+from message.scheduling import next_occurrence, plan_next_date, prefetched_clients
+from message.services import deliver_mailing
+from message.smtp_pool import SMTPConnectionPool
+from message.stats import STATS_FIELDS, rebuild_mailing_stats, update_mailing_stats
+from users.models import User
+
+
+def make_mailing(owner, clients=3, body="Текст письма", **fields):
+    """
+    Рассылка с сообщением и clients клиентами владельца
+    """
+    message = Message.objects.create(title_letter="Тема", body_letter=body, owner=owner)
+    mailing = MailingList.objects.create(message=message, owner=owner, **fields)
+    first = Client.objects.count()
+    mailing.clients.set(
+        Client.objects.bulk_create(
+            Client(name=f"Клиент {number}", email=f"client{number}@example.com", owner=owner)
+            for number in range(first, first + clients)
+        )
+    )
+    return mailing
+
+
+class SMTPSinkTestCase(TestCase):
+    """
+    Тесты с локальным фейковым SMTP-сервером (benchmark.smtp_sink)
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.sink = SMTPSink(("127.0.0.1", 0))
+        cls.sink.start()
+        cls.smtp_settings = override_settings(
+            EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+            EMAIL_HOST="127.0.0.1",
+            EMAIL_PORT=cls.sink.server_address[1],
+            EMAIL_HOST_USER="noreply@example.com",
+            EMAIL_HOST_PASSWORD="",
+            EMAIL_USE_TLS=False,
+            EMAIL_USE_SSL=False,
+        )
+        cls.smtp_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.smtp_settings.disable()
+        cls.sink.shutdown()
+        cls.sink.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.sink.reset()
+        smtp_pool._pool = None
+        self.owner = User.objects.create(email="owner@example.com")
+
+    def tearDown(self):
+        smtp_pool.get_connection_pool().close_all()
+
+
+class SMTPPoolTestCase(SMTPSinkTestCase):
+    """
+    Пул SMTP-соединений: проверка NOOP и переподключение
+    """
+
+    def send(self, pool):
+        with pool.connection() as connection:
+            EmailMessage("Тема", "Текст", to=["client@example.com"], connection=connection).send()
+
+    def test_alive_connection_is_reused_after_noop(self):
+        pool = SMTPConnectionPool(size=1, max_idle=60)
+        self.send(pool)
+        self.send(pool)
+        pool.close_all()
+
+        self.assertEqual(self.sink.stats["connections"], 1)
+        self.assertEqual(self.sink.stats["noops"], 1)
+        self.assertEqual(self.sink.stats["messages"], 2)
+
+    def test_closed_connection_is_reopened(self):
+        pool = SMTPConnectionPool(size=1, max_idle=60)
+        self.send(pool)
+        backend, _ = pool._idle[0]
+        # Соединение разорвано, как после таймаута простоя на сервере
+        backend.connection.sock.shutdown(socket.SHUT_RDWR)
+
+        self.send(pool)
+        pool.close_all()
+
+        self.assertEqual(self.sink.stats["connections"], 2)
+        self.assertEqual(self.sink.stats["messages"], 2)
+
+    def test_idle_connection_is_reopened_without_noop(self):
+        pool = SMTPConnectionPool(size=1, max_idle=0)
+        self.send(pool)
+        self.send(pool)
+        pool.close_all()
+
+        self.assertEqual(self.sink.stats["connections"], 2)
+        self.assertEqual(self.sink.stats["noops"], 0)
+
+
+class AsyncDrainTestCase(SMTPSinkTestCase):
+    """
+    Отправка исходящей очереди через asyncio (drain_outbox_async)
+    """
+
+    @override_settings(MAILING_CHUNK_SIZE=1, ATTEMPT_BATCH_SIZE=5, MAILING_PREFETCH_CLIENTS=False)
+    def test_attempts_over_batch_size_are_recorded(self):
+        mailing = make_mailing(self.owner, clients=12)
+        job = DeliveryJob.objects.create(mailing_list=mailing)
+
+        report = async_to_sync(drain_outbox_async)(deadline=30)
+
+        self.assertEqual(report.succeeded, 1)
+        self.assertEqual(self.sink.stats["messages"], 12)
+        self.assertEqual(Attempt.objects.filter(mailing_list=mailing).count(), 12)
+        job.refresh_from_db()
+        self.assertEqual(job.status, "Отправлено")
+        self.assertIsNone(job.locked_until)
+
+    @override_settings(DISPATCH_PER_HOST_LIMIT=2)
+    def test_claims_are_bounded_and_started_sends_finish_after_deadline(self):
+        jobs = [
+            DeliveryJob.objects.create(mailing_list=make_mailing(self.owner, clients=0))
+            for _ in range(6)
+        ]
+
+        async def slow_send(item, attempts):
+            await asyncio.sleep(0.3)
+            attempts.append(Attempt(mailing_list=item, status="Успешно"))
+
+        with mock.patch("message.async_dispatch.asending_a_message", slow_send):
+            report = async_to_sync(drain_outbox_async)(deadline=0.45)
+
+        self.assertTrue(report.deadline_reached)
+        self.assertEqual(report.submitted, 4)
+        self.assertEqual(report.succeeded, 4)
+        self.assertEqual(report.deferred, 0)
+        statuses = [
+            (job.status, job.locked_until)
+            for job in DeliveryJob.objects.filter(pk__in=[job.pk for job in jobs])
+        ]
+        self.assertEqual(statuses.count(("Отправлено", None)), 4)
+        self.assertEqual(statuses.count(("В очереди", None)), 2)
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=2)
+    def test_failed_job_is_retried_then_dead_lettered(self):
+        mailing = make_mailing(self.owner, clients=1)
+        self.sink.refused.add("client0@example.com")
+        job = DeliveryJob.objects.create(mailing_list=mailing)
+
+        async_to_sync(drain_outbox_async)(deadline=30)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts_count), ("В очереди", 1))
+        self.assertGreater(job.available_at, timezone.now())
+        self.assertIn("client0@example.com", job.last_error)
+
+        DeliveryJob.objects.filter(pk=job.pk).update(available_at=timezone.now())
+        async_to_sync(drain_outbox_async)(deadline=30)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts_count), ("Не доставлено", 2))
+
+
+@override_settings(MAILING_CHUNK_SIZE=10)
+class PersonalizedRefusedTestCase(SMTPSinkTestCase):
+    """
+    Отклоненный адрес в пачке персональных писем не срывает отправку остальным
+    """
+
+    def deliver(self, mailing):
+        return deliver_mailing(mailing)
+
+    def test_refused_recipient_does_not_abort_chunk(self):
+        mailing = make_mailing(self.owner, clients=7, body="Здравствуйте, {{ name }}")
+        self.sink.refused.add("client2@example.com")
+
+        attempts = self.deliver(mailing)
+
+        self.assertEqual(self.sink.stats["messages"], 6)
+        self.assertEqual(len(attempts), 1)
+        self.assertEqual(attempts[0].status, "Успешно")
+        self.assertIn("отклонено адресов: 1", attempts[0].mail_server_response)
+        self.assertIn("client2@example.com", attempts[0].mail_server_response)
+
+    def test_chunk_fails_when_nothing_delivered(self):
+        mailing = make_mailing(self.owner, clients=2, body="Здравствуйте, {{ name }}")
+        self.sink.refused.update({"client0@example.com", "client1@example.com"})
+
+        attempts = self.deliver(mailing)
+
+        self.assertEqual(self.sink.stats["messages"], 0)
+        self.assertEqual(attempts[0].status, "Не успешно")
+        self.assertIn("Не доставлено", attempts[0].mail_server_response)
+
+
+class AsyncPersonalizedRefusedTestCase(PersonalizedRefusedTestCase):
+    """
+    То же для асинхронной отправки
+    """
+
+    def deliver(self, mailing):
+        attempts = []
+        async_to_sync(asending_a_message)(mailing, attempts)
+        return attempts
+
+
+@override_settings(MAILING_CHUNK_SIZE=1)
+class EnvelopeAddressTestCase(SMTPSinkTestCase):
+    """
+    Адреса пачки готовятся для SMTP, как в send_mail; ошибка пачки
+    не оставляет незавершенную транзакцию на соединении
+    """
+
+    def deliver(self, mailing):
+        return deliver_mailing(mailing)
+
+    def test_internationalised_domain_is_sent_as_punycode(self):
+        mailing = make_mailing(self.owner, clients=1)
+        mailing.clients.add(Client.objects.create(name="Клиент", email="user@пример.рф"))
+
+        attempts = self.deliver(mailing)
+
+        self.assertEqual([attempt.status for attempt in attempts], ["Успешно", "Успешно"])
+        self.assertEqual(self.sink.stats["recipients"], 2)
+
+    def test_unexpected_error_reconnects(self):
+        broken = Client.objects.create(name="Клиент", email="broken\n@example.com")
+        mailing = make_mailing(self.owner, clients=2)
+        mailing.clients.add(broken)
+
+        with self.assertLogs("message", "ERROR"):
+            attempts = self.deliver(mailing)
+
+        self.assertEqual(
+            [attempt.status for attempt in attempts], ["Не успешно", "Успешно", "Успешно"]
+        )
+        self.assertEqual(self.sink.stats["messages"], 2)
+        self.assertEqual(self.sink.stats["connections"], 2)
+
+
+class AsyncEnvelopeAddressTestCase(EnvelopeAddressTestCase):
+    """
+    То же для асинхронной отправки
+    """
+
+    def deliver(self, mailing):
+        attempts = []
+        async_to_sync(asending_a_message)(mailing, attempts)
+        return attempts
+
+
+class DBTimerTestCase(TestCase):
+    """
+    Обертка SQL ставится на соединение один раз и снимается после замера
+    """
+
+    def test_reconnects_do_not_stack_wrappers(self):
+        timer = DBTimer()
+        with timer.timing():
+            for _ in range(3):
+                connection_created.send(sender=type(connection), connection=connection)
+            self.assertEqual(connection.execute_wrappers.count(timer), 1)
+            User.objects.count()
+        self.assertNotIn(timer, connection.execute_wrappers)
+        self.assertGreater(timer.seconds, 0)
+
+
+@override_settings(OUTBOX_DRAIN_IN_TICK=False)
+class SchedulerDaemonTestCase(TestCase):
+    """
+    Ошибка итерации демона не останавливает планировщик
+    """
+
+    def test_error_is_logged_and_state_resynced(self):
+        owner = User.objects.create(email="owner@example.com")
+        make_mailing(
+            owner,
+            clients=0,
+            status="Запущена",
+            next_date=timezone.now() - timedelta(minutes=1),
+        )
+        daemon = SchedulerDaemon(max_sleep=5)
+        tick = mock.Mock(side_effect=[OperationalError("server closed the connection"), None])
+
+        with mock.patch("message.daemon.periodicity_sending", tick), \
+                mock.patch("message.daemon.close_old_connections"), \
+                mock.patch.object(connection, "close") as close, \
+                mock.patch("message.daemon.time.sleep") as sleep, \
+                mock.patch.object(daemon, "wait", side_effect=[KeyboardInterrupt]), \
+                self.assertLogs("message.daemon", "ERROR"):
+            with self.assertRaises(KeyboardInterrupt):
+                daemon.run_forever()
+
+        self.assertEqual(tick.call_count, 2)
+        sleep.assert_called_once_with(2)
+        close.assert_called_once_with()
+
+    def test_without_notifications_resync_every_max_sleep(self):
+        daemon = SchedulerDaemon(resync_interval=600, max_sleep=5)
+
+        daemon.resync()
+
+        self.assertLessEqual(daemon._resync_at - time.monotonic(), 5)
+
+    def test_subscription_uses_own_connection_and_forces_resync_when_new(self):
+        daemon = SchedulerDaemon()
+        daemon.resync()
+        listener = mock.MagicMock(closed=False)
+
+        with mock.patch.object(connection, "vendor", "postgresql"), \
+                mock.patch.object(connection, "get_new_connection", return_value=listener):
+            self.assertIs(daemon._listen(), listener)
+            self.assertEqual(daemon._resync_at, 0)
+            daemon._resync_at = 1
+            self.assertIs(daemon._listen(), listener)
+
+        self.assertEqual(daemon._resync_at, 1)
+        listener.cursor().__enter__().execute.assert_called_once_with("LISTEN mailing_changed")
+
+
+class ClientImportTestCase(TestCase):
+    """
+    Импорт клиентов из CSV
+    """
+
+    def setUp(self):
+        self.owner = User.objects.create(email="owner@example.com")
+
+    def import_csv(self, text, encoding="utf-8", **kwargs):
+        return import_clients(BytesIO(text.encode(encoding)), "csv", owner=self.owner, **kwargs)
+
+    def test_cp1251_file_is_decoded(self):
+        report = self.import_csv(
+            "email;ФИО\nivan@example.com;Иван Петров\n", encoding="cp1251"
+        )
+
+        self.assertEqual(report.created, 1)
+        self.assertEqual(Client.objects.get().name, "Иван Петров")
+
+    def test_decode_error_reports_line_and_committed_rows(self):
+        data = "email,name\na@example.com,Анна\nb@example.com,Борис\n".encode()
+        data += "c@example.com,\xc2\xe5\xf0\xe0\n".encode("latin-1")
+
+        with self.assertRaisesMessage(ValidationError, "Строка 4") as raised:
+            import_clients(BytesIO(data), "csv", owner=self.owner, batch_size=1)
+
+        self.assertIn("уже добавлено клиентов: 2", str(raised.exception))
+        self.assertEqual(Client.objects.count(), 2)
+
+    def test_existing_address_is_matched_case_insensitively(self):
+        Client.objects.create(name="Старый", email="Old@Example.com", owner=self.owner)
+
+        report = self.import_csv("email\nold@example.com\nnew@example.com\n")
+
+        self.assertEqual(report.created, 1)
+        self.assertEqual(report.duplicates, 1)
+        self.assertEqual(Client.objects.count(), 2)
+
+    def test_rows_skipped_on_conflict_are_not_counted(self):
+        Client.objects.create(name="Чужой", email="taken@example.com")
+
+        # Адрес добавлен параллельным импортом после проверки существующих
+        with mock.patch.object(Client.objects, "annotate") as annotate:
+            annotate.return_value.filter.return_value.values_list.return_value = []
+            report = self.import_csv("email\ntaken@example.com\nfree@example.com\n")
+
+        self.assertEqual(report.created, 1)
+        self.assertEqual(report.duplicates, 1)
+
+
+@override_settings(MAILING_CATCH_UP_POLICY="replay")
+class EnqueueDueMailingsTestCase(TestCase):
+    """
+    Постановка наступивших рассылок в исходящую очередь
+    """
+
+    def test_replayed_mailing_gets_one_job_per_tick(self):
+        owner = User.objects.create(email="owner@example.com")
+        now = timezone.now()
+        mailings = [
+            make_mailing(
+                owner,
+                clients=0,
+                status="Запущена",
+                date_and_time_of_sending=now - timedelta(days=5),
+                next_date=now - timedelta(days=5),
+            )
+            for _ in range(5)
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            enqueued = enqueue_due_mailings(batch_size=2, now=now)
+
+        self.assertEqual(enqueued, 5)
+        for mailing in mailings:
+            self.assertEqual(mailing.delivery_jobs.count(), 1)
+            mailing.refresh_from_db()
+            self.assertLess(mailing.next_date, now)
+        selects = [
+            query["sql"] for query in queries.captured_queries
+            if query["sql"].startswith('SELECT "message_mailinglist"')
+        ]
+        self.assertEqual(len(selects), 3)
+        self.assertFalse(any("NOT" in sql for sql in selects))
+
+
+class ClaimJobsTestCase(TestCase):
+    """
+    Захват заданий исходящей очереди
+    """
+
+    def test_clients_are_not_prefetched_by_default(self):
+        mailing = make_mailing(User.objects.create(email="owner@example.com"), clients=3)
+        DeliveryJob.objects.create(mailing_list=mailing)
+
+        [job] = claim_jobs()
+
+        self.assertIsNotNone(job.locked_until)
+        self.assertIsNone(prefetched_clients(job.mailing_list))
+
+
+class SchedulingTestCase(TestCase):
+    """
+    Даты отправки рассылок: конец месяца, переход на летнее время, пропущенные отправки
+    """
+    zone = ZoneInfo("Europe/Berlin")
+
+    def setUp(self):
+        self.owner = User.objects.create(email="owner@example.com", time_zone="Europe/Berlin")
+
+    def mailing(self, periodicity, anchor, next_date=None):
+        return MailingList(
+            owner=self.owner,
+            periodicity=periodicity,
+            date_and_time_of_sending=anchor,
+            next_date=next_date or anchor,
+        )
+
+    def test_month_end_is_clamped_without_drifting(self):
+        anchor = datetime(2025, 1, 31, 10, tzinfo=self.zone)
+        mailing = self.mailing("Раз в месяц", anchor)
+
+        february = next_occurrence(mailing, anchor)
+        march = next_occurrence(mailing, february)
+
+        self.assertEqual(february, datetime(2025, 2, 28, 10, tzinfo=self.zone))
+        self.assertEqual(march, datetime(2025, 3, 31, 10, tzinfo=self.zone))
+
+    def test_local_time_is_kept_across_dst(self):
+        anchor = datetime(2025, 3, 29, 10, tzinfo=self.zone)
+        mailing = self.mailing("Раз в день", anchor)
+
+        after_switch = next_occurrence(mailing, anchor)
+
+        self.assertEqual(timezone.localtime(after_switch, self.zone).hour, 10)
+        self.assertEqual(after_switch.timestamp() - anchor.timestamp(), 23 * 3600)
+
+    def overdue(self, lateness):
+        now = datetime(2025, 6, 10, 12, tzinfo=self.zone)
+        anchor = datetime(2025, 6, 1, 9, tzinfo=self.zone)
+        return now, self.mailing("Раз в день", anchor, next_date=now - lateness)
+
+    @override_settings(MAILING_CATCH_UP_POLICY="skip", MAILING_MISFIRE_GRACE=3600)
+    def test_skip_policy(self):
+        now, mailing = self.overdue(timedelta(days=2))
+        self.assertEqual(
+            plan_next_date(mailing, now), (False, datetime(2025, 6, 11, 9, tzinfo=self.zone))
+        )
+        now, mailing = self.overdue(timedelta(minutes=10))
+        self.assertEqual(
+            plan_next_date(mailing, now), (True, datetime(2025, 6, 11, 9, tzinfo=self.zone))
+        )
+
+    @override_settings(MAILING_CATCH_UP_POLICY="coalesce")
+    def test_coalesce_policy(self):
+        now, mailing = self.overdue(timedelta(days=2, hours=3))
+        self.assertEqual(
+            plan_next_date(mailing, now), (True, datetime(2025, 6, 11, 9, tzinfo=self.zone))
+        )
+
+    @override_settings(MAILING_CATCH_UP_POLICY="replay")
+    def test_replay_policy(self):
+        now, mailing = self.overdue(timedelta(days=2, hours=3))
+        self.assertEqual(
+            plan_next_date(mailing, now), (True, datetime(2025, 6, 9, 9, tzinfo=self.zone))
+        )
+
+
+@override_settings(OUTBOX_MAX_ATTEMPTS=3, OUTBOX_BACKOFF_BASE=60, OUTBOX_BACKOFF_MAX=200)
+class FinishJobTestCase(TestCase):
+    """
+    Повтор заданий с экспоненциальной задержкой и перевод в "Не доставлено"
+    """
+
+    def test_backoff_grows_and_is_capped(self):
+        for attempts_count, (low, high) in ((1, (30, 60)), (2, (60, 120)), (5, (100, 200))):
+            for _ in range(20):
+                delay = backoff_delay(attempts_count).total_seconds()
+                self.assertTrue(low <= delay <= high, (attempts_count, delay))
+
+    def test_failures_are_retried_then_dead_lettered(self):
+        job = DeliveryJob(locked_until=timezone.now())
+
+        finish_job(job, "550 User unknown")
+        self.assertEqual((job.status, job.attempts_count), ("В очереди", 1))
+        self.assertIsNone(job.locked_until)
+        self.assertGreater(job.available_at, timezone.now() + timedelta(seconds=29))
+
+        finish_job(job, "550 User unknown")
+        finish_job(job, "550 User unknown")
+        self.assertEqual((job.status, job.attempts_count), ("Не доставлено", 3))
+        self.assertEqual(job.last_error, "550 User unknown")
+
+    def test_partial_delivery_is_sent_with_failed_chunks_recorded(self):
+        attempts = [
+            Attempt(status="Успешно", mail_server_response="Пачка 1: Доставлено"),
+            Attempt(mail_server_response="Пачка 2: 421 Try again later"),
+        ]
+        job = DeliveryJob()
+
+        finish_job(job, delivery_error(attempts), partial_delivery_error(attempts))
+
+        self.assertEqual(job.status, "Отправлено")
+        self.assertEqual(job.last_error, "Пачка 2: 421 Try again later")
+        self.assertIsNone(partial_delivery_error(attempts[1:]))
+
+    def test_success_clears_error(self):
+        job = DeliveryJob(attempts_count=1, last_error="421 Try again later")
+
+        finish_job(job)
+
+        self.assertEqual((job.status, job.attempts_count, job.last_error), ("Отправлено", 2, None))
+
+
+class KeysetPaginatorTestCase(TestCase):
+    """
+    Курсоры keyset-пагинации
+    """
+
+    def setUp(self):
+        Client.objects.bulk_create(
+            Client(name=f"Клиент {number % 3}", email=f"client{number}@example.com")
+            for number in range(7)
+        )
+        self.paginator = KeysetPaginator(Client.objects.all(), ("name", "id"), 3)
+        self.expected = list(Client.objects.order_by("name", "id"))
+
+    def test_forward_and_backward_pages(self):
+        pages = [self.paginator.page()]
+        while pages[-1].has_next:
+            pages.append(self.paginator.page(after=pages[-1].next_cursor))
+
+        self.assertEqual([len(page.object_list) for page in pages], [3, 3, 1])
+        rows = [row for page in pages for row in page.rows]
+        self.assertEqual(rows, list(enumerate(self.expected, start=1)))
+        self.assertFalse(pages[0].has_previous)
+
+        previous = self.paginator.page(before=pages[2].previous_cursor)
+        self.assertEqual(previous.rows, pages[1].rows)
+        first = self.paginator.page(before=previous.previous_cursor)
+        self.assertEqual(first.rows, pages[0].rows)
+        self.assertFalse(first.has_previous)
+
+    def test_invalid_cursor(self):
+        for cursor in ("не-курсор", "W10", "WyJ4Il0"):
+            with self.assertRaises(ValueError):
+                self.paginator.page(after=cursor)
+
+
+class ArchiveAttemptsTestCase(TestCase):
+    """
+    Перенос старых попыток в архив по месяцам
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(ATTEMPT_ARCHIVE_DIR=directory.name))
+        self.directory = directory.name
+        self.mailing = make_mailing(User.objects.create(email="owner@example.com"), clients=0)
+
+    def attempt(self, moment, status="Успешно"):
+        with AttemptRecorder() as recorder:
+            recorder.add_attempts([Attempt(mailing_list=self.mailing, status=status)])
+        attempt = Attempt.objects.latest("pk")
+        Attempt.objects.filter(pk=attempt.pk).update(date_time_last_attempt=moment)
+        return attempt.pk
+
+    def archived_ids(self, path):
+        with gzip.open(path, "rt") as file:
+            return [json.loads(line)["id"] for line in file]
+
+    def test_months_are_split_at_boundaries(self):
+        utc = ZoneInfo("UTC")
+        january = self.attempt(datetime(2025, 1, 31, 23, 59, 59, tzinfo=utc))
+        february = self.attempt(datetime(2025, 2, 1, tzinfo=utc))
+        recent = self.attempt(timezone.now())
+
+        archived = archive_attempts(retention_days=30)
+
+        self.assertEqual(
+            [(path.rsplit("/", 1)[-1], count) for path, count in archived[:2]],
+            [("attempts-2025-01.jsonl.gz", 1), ("attempts-2025-02.jsonl.gz", 1)],
+        )
+        self.assertEqual(self.archived_ids(archived[0][0]), [january])
+        self.assertEqual(self.archived_ids(archived[1][0]), [february])
+        self.assertEqual(list(Attempt.objects.values_list("pk", flat=True)), [recent])
+
+    def test_rows_added_during_export_are_kept(self):
+        old = datetime(2025, 1, 10, tzinfo=ZoneInfo("UTC"))
+        first = self.attempt(old)
+        late = []
+
+        def write_then_insert(attempts, path):
+            late.append(self.attempt(old))
+            write_archive(attempts, path)
+
+        with mock.patch("message.retention.write_archive", write_then_insert):
+            archived = archive_attempts(retention_days=30, batch_size=1)
+
+        self.assertEqual(self.archived_ids(archived[0][0]), [first])
+        self.assertEqual(list(Attempt.objects.values_list("pk", flat=True)), late)
+
+    def test_no_delete_keeps_rows(self):
+        self.attempt(datetime(2025, 1, 10, tzinfo=ZoneInfo("UTC")))
+
+        archive_attempts(retention_days=30, delete=False)
+
+        self.assertEqual(Attempt.objects.count(), 1)
+        self.assertEqual(MailingStats.objects.get().archived_total, 0)
+
+    def test_stats_survive_archive_and_rebuild(self):
+        old = datetime(2025, 1, 10, tzinfo=ZoneInfo("UTC"))
+        for status in ("Успешно", "Успешно", "Успешно", "Не успешно"):
+            self.attempt(old, status)
+        self.attempt(timezone.now())
+
+        archive_attempts(retention_days=30, batch_size=2)
+        rebuild_mailing_stats()
+
+        stats = MailingStats.objects.get()
+        self.assertEqual((stats.total, stats.successful, stats.failed), (5, 4, 1))
+        self.assertEqual((stats.archived_total, stats.archived_successful), (4, 3))
+
+
+class OwnerRequiredViewsTestCase(TestCase):
+    """
+    Страницы объекта доступны только владельцу и суперпользователю
+    """
+
+    def setUp(self):
+        self.owner = User.objects.create(email="owner@example.com")
+        self.stranger = User.objects.create(email="stranger@example.com")
+        self.admin = User.objects.create(email="admin@example.com", is_superuser=True)
+        self.mailing = make_mailing(self.owner, clients=1)
+        self.message = self.mailing.message
+        self.urls = [
+            reverse("message:message_detail", args=[self.message.pk]),
+            reverse("message:message_update", args=[self.message.pk]),
+            reverse("message:message_delete", args=[self.message.pk]),
+            reverse("message:mailinglist_update", args=[self.mailing.pk]),
+            reverse("message:mailinglist_delete", args=[self.mailing.pk]),
+        ]
+
+    def test_stranger_is_forbidden(self):
+        self.client.force_login(self.stranger)
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 403)
+
+        response = self.client.post(reverse("message:mailinglist_delete", args=[self.mailing.pk]))
+
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(MailingList.objects.filter(pk=self.mailing.pk).exists())
+
+    def test_owner_and_superuser_are_allowed(self):
+        for user in (self.owner, self.admin):
+            self.client.force_login(user)
+            for url in self.urls:
+                with self.subTest(user=user.email, url=url):
+                    self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_owner_delete(self):
+        self.client.force_login(self.owner)
+
+        response = self.client.post(reverse("message:mailinglist_delete", args=[self.mailing.pk]))
+
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(MailingList.objects.filter(pk=self.mailing.pk).exists())
+
+    def test_object_is_loaded_once(self):
+        self.client.force_login(self.owner)
+        # Сессия, пользователь, объект вместе с владельцем и права пользователя для шаблона;
+        # заголовок рассылки (__str__) дополнительно читает ее сообщение
+        pages = [
+            (reverse("message:message_detail", args=[self.message.pk]), "message_message", 5),
+            (
+                reverse("message:mailinglist_delete", args=[self.mailing.pk]),
+                "message_mailinglist",
+                6,
+            ),
+        ]
+        for url, table, expected in pages:
+            with self.subTest(url=url), CaptureQueriesContext(connection) as queries:
+                with self.assertNumQueries(expected):
+                    self.client.get(url)
+            sql = [query["sql"] for query in queries.captured_queries]
+            self.assertEqual(sum(query.startswith(f'SELECT "{table}"') for query in sql), 1)
+            self.assertEqual(sum(query.startswith('SELECT "users_user"') for query in sql), 1)
+
+
+class MailingStatsTestCase(TestCase):
+    """
+    Накопление статистики рассылок через F() при записи попыток
+    """
+
+    def setUp(self):
+        self.mailing = make_mailing(User.objects.create(email="owner@example.com"), clients=0)
+        self.moment = datetime(2025, 3, 1, 12, tzinfo=ZoneInfo("UTC"))
+
+    def attempts(self, *statuses, minutes=0):
+        return [
+            Attempt(
+                mailing_list=self.mailing,
+                status=status,
+                mail_server_response=f"{status} {number}",
+                date_time_last_attempt=self.moment + timedelta(minutes=minutes + number),
+            )
+            for number, status in enumerate(statuses)
+        ]
+
+    def test_counters_accumulate_across_batches(self):
+        update_mailing_stats(self.attempts("Успешно", "Не успешно", "Успешно"))
+        # Счетчики изменил другой обработчик после чтения статистики
+        MailingStats.objects.filter(pk=self.mailing.pk).update(total=10, successful=8, failed=2)
+        update_mailing_stats(self.attempts("Не успешно", "Успешно", minutes=10))
+
+        stats = MailingStats.objects.get()
+        self.assertEqual((stats.total, stats.successful, stats.failed), (12, 9, 3))
+        self.assertEqual(stats.last_attempt_at, self.moment + timedelta(minutes=11))
+        self.assertEqual(stats.last_error, "Не успешно 0")
+
+    def test_older_batch_keeps_last_attempt_and_error(self):
+        update_mailing_stats(self.attempts("Не успешно", minutes=10))
+        update_mailing_stats(self.attempts("Успешно"))
+
+        stats = MailingStats.objects.get()
+        self.assertEqual((stats.total, stats.successful, stats.failed), (2, 1, 1))
+        self.assertEqual(stats.last_attempt_at, self.moment + timedelta(minutes=10))
+        self.assertEqual(stats.last_error, "Не успешно 0")
+
+    def test_matches_rebuild(self):
+        with AttemptRecorder(batch_size=2) as recorder:
+            recorder.add_attempts(self.attempts("Успешно", "Не успешно", "Успешно", "Успешно"))
+        expected = MailingStats.objects.values(*STATS_FIELDS).get()
+
+        MailingStats.objects.all().delete()
+        rebuild_mailing_stats()
+
+        self.assertEqual(MailingStats.objects.values(*STATS_FIELDS).get(), expected)
+        self.assertEqual((expected["total"], expected["failed"]), (4, 1))
+
+
+@override_settings(CACHE_ENABLED=True)
+class OwnerCacheTestCase(TestCase):
+    """
+    Сброс кеша страниц владельца при изменении его объектов
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create(email="owner@example.com")
+        self.other = User.objects.create(email="other@example.com")
+        self.mailing = make_mailing(self.owner, clients=1)
+
+    def versions(self):
+        return {scope: owner_version(scope) for scope in (self.owner.pk, self.other.pk, ALL_OWNERS)}
+
+    def assertBumped(self, before, *scopes):
+        after = self.versions()
+        self.assertEqual({scope for scope in before if before[scope] != after[scope]}, set(scopes))
+
+    def test_cached_value_is_rebuilt_after_save(self):
+        build = mock.Mock(side_effect=["первая", "вторая"])
+        self.assertEqual(get_or_build(self.owner.pk, "page", [1], build), "первая")
+        self.assertEqual(get_or_build(self.owner.pk, "page", [1], build), "первая")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mailing.message.save()
+
+        self.assertEqual(get_or_build(self.owner.pk, "page", [1], build), "вторая")
+        self.assertEqual(build.call_count, 2)
+
+    def test_save_bumps_owner_and_all_owners_after_commit(self):
+        before = self.versions()
+        with self.captureOnCommitCallbacks(execute=True):
+            Client.objects.create(name="Клиент", email="new@example.com", owner=self.owner)
+            self.assertBumped(before)
+
+        self.assertBumped(before, self.owner.pk, ALL_OWNERS)
+
+    def test_mailing_clients_change_bumps_owner(self):
+        client = Client.objects.create(name="Клиент", email="new@example.com", owner=self.other)
+        before = self.versions()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mailing.clients.add(client)
+
+        self.assertBumped(before, self.owner.pk, ALL_OWNERS)
+
+    def test_recorder_flush_bumps_owner(self):
+        before = self.versions()
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with AttemptRecorder() as recorder:
+                recorder.add_attempts([Attempt(mailing_list=self.mailing, status="Успешно")])
+
+        # bulk_create не отправляет сигналы - кеш сбрасывает сам буфер
+        self.assertEqual(callbacks, [])
+        self.assertBumped(before, self.owner.pk, ALL_OWNERS)
+
+    def test_evicted_version_does_not_revive_old_entries(self):
+        before = owner_version(self.owner.pk)
+        cache.delete(f"owner_cache:version:{self.owner.pk}")
+
+        self.assertNotEqual(owner_version(self.owner.pk), before)
+
+
+class AttemptExportTestCase(TestCase):
+    """
+    Потоковая выгрузка попыток отправки: фильтры, форматы и сжатие gzip
+    """
+
+    def setUp(self):
+        self.owner = User.objects.create(email="owner@example.com")
+        self.mailing = make_mailing(self.owner, clients=0)
+        self.other = make_mailing(User.objects.create(email="other@example.com"), clients=0)
+        mine, other = self.mailing, self.other
+        self.ids = {
+            name: self.attempt(mailing, status, *moment)
+            for name, mailing, status, moment in (
+                ("before", mine, "Успешно", (2025, 2, 28, 23, 59, 59)),
+                ("first", mine, "Успешно", (2025, 3, 1)),
+                ("failed", mine, "Не успешно", (2025, 3, 2, 12)),
+                ("last", mine, "Успешно", (2025, 3, 2, 23, 59, 59)),
+                ("after", mine, "Успешно", (2025, 3, 3)),
+                ("other", other, "Успешно", (2025, 3, 1, 12)),
+            )
+        }
+
+    def attempt(self, mailing, status, *moment):
+        attempt = Attempt.objects.create(
+            mailing_list=mailing, status=status, mail_server_response="250 OK"
+        )
+        Attempt.objects.filter(pk=attempt.pk).update(
+            date_time_last_attempt=datetime(*moment, tzinfo=ZoneInfo("UTC"))
+        )
+        return attempt.pk
+
+    def expected(self, *names):
+        return [self.ids[name] for name in names]
+
+    def test_filters(self):
+        march = {"date_from": date(2025, 3, 1), "date_to": date(2025, 3, 2)}
+        cases = [
+            ({"mailing": self.mailing, **march}, ["first", "failed", "last"]),
+            ({"mailing": self.mailing, "status": "Не успешно"}, ["failed"]),
+            ({"date_from": date(2025, 3, 2)}, ["failed", "last", "after"]),
+            ({"date_to": date(2025, 2, 28)}, ["before"]),
+            ({"owner": self.owner, **march}, ["first", "failed", "last"]),
+            ({}, ["before", "first", "failed", "last", "after", "other"]),
+        ]
+        for filters, names in cases:
+            with self.subTest(filters=filters):
+                attempts = filter_attempts(**filters)
+                self.assertEqual(list(attempts.values_list("pk", flat=True)), self.expected(*names))
+
+    def test_view_streams_gzip_of_own_attempts(self):
+        self.client.force_login(self.owner)
+
+        response = self.client.get(
+            reverse("message:attempt_export"),
+            {"format": "jsonl", "gzip": "on", "date_from": "2025-03-01"},
+        )
+
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertIn(".jsonl.gz", response["Content-Disposition"])
+        lines = gzip.decompress(b"".join(response.streaming_content)).decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual(
+            [row["id"] for row in rows], self.expected("first", "failed", "last", "after")
+        )
+        self.assertEqual(rows[1]["status"], "Не успешно")
+        self.assertEqual(rows[0]["date_time_last_attempt"], "2025-03-01T00:00:00+00:00")
+
+    def test_view_rejects_foreign_mailing(self):
+        self.client.force_login(self.owner)
+
+        response = self.client.get(reverse("message:attempt_export"), {"mailing": self.other.pk})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_gzip_stream_of_many_blocks_is_valid(self):
+        with mock.patch("message.exporting.STREAM_BUFFER_SIZE", 64):
+            plain = list(export_attempts(filter_attempts(), "csv"))
+            compressed = list(export_attempts(filter_attempts(), "csv", compress=True))
+
+        self.assertGreater(len(plain), 1)
+        self.assertEqual(gzip.decompress(b"".join(compressed)), b"".join(plain))
+        lines = b"".join(plain).decode().splitlines()
+        self.assertEqual(lines[0], ",".join(EXPORT_FIELDS))
+        self.assertEqual(len(lines), 1 + len(self.ids))
+
+    def test_command_writes_filtered_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/attempts.csv.gz"
+            call_command(
+                "export_attempts", "--status", "Не успешно", "--gzip", "--output", path
+            )
+            with gzip.open(path, "rt") as file:
+                lines = file.read().splitlines()
+
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith(f"{self.ids['failed']},{self.mailing.pk},"))
+
+
+class DispatchEngineTestCase(TestCase):
+    """
+    Параллельная отправка: ограничение сессий на SMTP-хост и дедлайн тика
+    """
+
+    def engine(self, **options):
+        return DispatchEngine(executor="thread", host_of=lambda item: item[0], **options)
+
+    def test_per_host_limit(self):
+        lock = threading.Lock()
+        active, peaks = Counter(), Counter()
+        other = {"a": "b", "b": "a"}
+
+        def send(item):
+            host = item[0]
+            with lock:
+                active[host] += 1
+                peaks[host] = max(peaks[host], active[host])
+                peaks["all"] = max(peaks["all"], active[host] + active[other[host]])
+            time.sleep(0.02)
+            with lock:
+                active[host] -= 1
+
+        items = [(host, number) for host in "ab" for number in range(6)]
+        report = self.engine(max_workers=4, per_host_limit=2, deadline=10).run(items, send)
+
+        self.assertEqual((peaks["a"], peaks["b"], peaks["all"]), (2, 2, 4))
+        self.assertEqual((report.submitted, report.succeeded, report.deferred), (12, 12, 0))
+        self.assertEqual(report.per_host, Counter(a=6, b=6))
+
+    def test_deadline_defers_items_not_started(self):
+        started = []
+
+        def send(item):
+            started.append(item)
+            time.sleep(0.2)
+
+        items = [("a", number) for number in range(5)]
+        report = self.engine(max_workers=1, deadline=0.05).run(items, send)
+
+        # Начатая задача дожидается завершения, остальные откладываются до следующего тика
+        self.assertTrue(report.deadline_reached)
+        self.assertEqual(started, items[:1])
+        self.assertEqual((report.succeeded, report.deferred), (1, 4))
+        self.assertGreaterEqual(report.elapsed, 0.2)
+
+    def test_results_and_errors_are_reported(self):
+        def send(item):
+            if item[1] == 1:
+                raise ValueError("550 User unknown")
+            return item[1] * 10
+
+        succeeded, failed = [], []
+        with self.assertLogs("message.dispatch", "ERROR"):
+            report = self.engine(deadline=10).run(
+                [("a", 0), ("a", 1), ("b", 2)],
+                send,
+                on_success=lambda item, result: succeeded.append((item, result)),
+                on_failure=lambda item, error: failed.append((item, str(error))),
+            )
+
+        self.assertCountEqual(succeeded, [(("a", 0), 0), (("b", 2), 20)])
+        self.assertEqual(failed, [(("a", 1), "550 User unknown")])
+        self.assertEqual((report.succeeded, report.failed, report.deferred), (2, 1, 0))
+
+    def test_unknown_executor(self):
+        with self.assertRaises(ValueError):
+            DispatchEngine(executor="fibers")
@@ -10,6 +10,7 @@ from message.views import (
     ClientListView,
     ClientDetailView,
     ClientCreateView,
+    ClientImportView,
     ClientUpdateView,
     ClientDeleteView,
     MailingListListView,
@@ -19,6 +20,8 @@ from message.views import (
     MailingListDeleteView,
     toggle_status,
     AttemptListView,
+    attempt_export,
+    metrics_view,
     HomePageView,
 )
 
@@ -40,6 +43,7 @@ urlpatterns = [
     path("clients/", ClientListView.as_view(), name="client_view"),
     path("clients/<int:pk>", ClientDetailView.as_view(), name="client_detail"),
     path("clients/create/", ClientCreateView.as_view(), name="client_create"),
+    path("clients/import/", ClientImportView.as_view(), name="client_import"),
     path("clients/<int:pk>/update/", ClientUpdateView.as_view(), name="client_update"),
     path(
         "clients/<int:pk>/delete-confirm/",
@@ -69,4 +73,6 @@ urlpatterns = [
     ),
     path("mailing-list/<int:pk>/activate/", toggle_status, name="toggle_status"),
     path("mailing-list/<int:pk>/attempt/", AttemptListView, name="attempt_list"),
+    path("attempts/export/", attempt_export, name="attempt_export"),
+    path("metrics", metrics_view, name="metrics"),
 ]
\ No newline at end of file
@@ -2,10 +2,20 @@ import random
 
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.core.exceptions import PermissionDenied
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.conf import settings
+from django.db.models import Count
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse, reverse_lazy
+from django.utils.crypto import constant_time_compare
 from django.views.generic import (
+    FormView,
     ListView,
     DetailView,
     CreateView,
@@ -13,22 +23,32 @@ from django.views.generic import (
     DeleteView,
 )
 
-from blog.models import Blog
+from message.exporting import (
+    CONTENT_TYPES,
+    export_attempts,
+    export_file_name,
+    filter_attempts,
+)
 from message.forms import (
+    AttemptExportForm,
     MessageForm,
     ClientForm,
+    ClientImportForm,
     MailingListForm,
     MailingListModeratorForm,
     MailingListUpdateForm,
 )
+from message.importing import import_clients
+from message.metrics import METRICS_CONTENT_TYPE
+from message.metrics import render as render_metrics
+from message.mixins import KeysetListMixin, OwnedObjectMixin, OwnerRequiredMixin
 from message.models import Message, Client, MailingList
-from message.services import (
-    get_total_mailings_active_from_cache,
-    get_total_items_from_cache,
-)
+from message.owner_cache import ALL_OWNERS, get_or_build
+from message.pagination import KeysetPaginator
+from message.services import get_home_page_blogs, get_home_page_counts
 
 
-class MessageListView(ListView):
+class MessageListView(KeysetListMixin, ListView):
     """
     Контроллер для отображения всех сообщений
     """
@@ -45,22 +65,16 @@ class MessageListView(ListView):
         else:
             return Message.objects.none()
 
+    def json_row(self, message):
+        return {"id": message.pk, "title_letter": message.title_letter}
 
-class MessageDetailView(LoginRequiredMixin, UserPassesTestMixin, DetailView):
+
+class MessageDetailView(OwnerRequiredMixin, DetailView):
     """
     Контроллер для отображения конкретного сообщения
     """
     model = Message
 
-    def test_func(self):
-        """
-        Проверяет, может ли текущий пользователь просматривать сообщение
-        """
-        message = self.get_object()
-        user = self.request.user
-        if user.is_superuser or user == message.owner:
-            return True
-
 
 class MessageCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
     """
@@ -88,7 +102,7 @@ class MessageCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
             return True
 
 
-class MessageUpdateView(LoginRequiredMixin, UpdateView):
+class MessageUpdateView(LoginRequiredMixin, OwnedObjectMixin, UpdateView):
     """
     Контроллер для редактирования сообщения
     """
@@ -103,30 +117,20 @@ class MessageUpdateView(LoginRequiredMixin, UpdateView):
         """
         Отображает форму редактирования в зависимости от текущего пользователя
         """
-        user = self.request.user
-        if self.object.owner == user or user.is_superuser:
+        if self.is_owner():
             return MessageForm
         raise PermissionDenied
 
 
-class MessageDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
+class MessageDeleteView(OwnerRequiredMixin, DeleteView):
     """
     Контроллер для удаления сообщения
     """
     model = Message
     success_url = reverse_lazy("message:message_view")
 
-    def test_func(self):
-        """
-        Проверяет, может ли текущий пользователь удалить конкретное сообщение
-        """
-        message = self.get_object()
-        user = self.request.user
-        if user.is_superuser or user == message.owner:
-            return True
 
-
-class ClientListView(LoginRequiredMixin, ListView):
+class ClientListView(LoginRequiredMixin, KeysetListMixin, ListView):
     """
     Контроллер для отображения всех клиентов
     """
@@ -143,22 +147,21 @@ class ClientListView(LoginRequiredMixin, ListView):
         else:
             return Client.objects.none()
 
+    def json_row(self, client):
+        return {
+            "id": client.pk,
+            "name": client.name,
+            "email": client.email,
+            "comment": client.comment,
+        }
+
 
-class ClientDetailView(LoginRequiredMixin, UserPassesTestMixin, DetailView):
+class ClientDetailView(OwnerRequiredMixin, DetailView):
     """
     Контроллер для отображения конкретного клиента
     """
     model = Client
 
-    def test_func(self):
-        """
-        Проверяет, может ли текущий пользователь просматривать конкретного клиента
-        """
-        client = self.get_object()
-        user = self.request.user
-        if user.is_superuser or user == client.owner:
-            return True
-
 
 class ClientCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
     """
@@ -189,7 +192,39 @@ class ClientCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
             return True
 
 
-class ClientUpdateView(LoginRequiredMixin, UpdateView):
+class ClientImportView(LoginRequiredMixin, UserPassesTestMixin, FormView):
+    """
+    Контроллер для импорта клиентов из файла CSV/XLSX
+    """
+    form_class = ClientImportForm
+    template_name = "message/client_import.html"
+
+    def form_valid(self, form):
+        """
+        Импортирует клиентов из файла и показывает итоги импорта
+        """
+        try:
+            report = import_clients(
+                form.cleaned_data["file"],
+                form.file_format,
+                owner=self.request.user,
+                encoding=form.cleaned_data["encoding"] or None,
+            )
+        except ValidationError as error:
+            form.add_error("file", error)
+            return self.form_invalid(form)
+        return self.render_to_response(self.get_context_data(form=form, report=report))
+
+    def test_func(self):
+        """
+        Проверяет, может ли текущий пользователь создавать клиентов
+        """
+        user = self.request.user
+        if user.is_superuser or user.is_authenticated and not user.is_staff:
+            return True
+
+
+class ClientUpdateView(LoginRequiredMixin, OwnedObjectMixin, UpdateView):
     """
     Контроллер для редактирования клиента
     """
@@ -204,30 +239,20 @@ class ClientUpdateView(LoginRequiredMixin, UpdateView):
         """
         Отображает форму редактирования в зависимости от текущего пользователя
         """
-        user = self.request.user
-        if self.object.owner == user or user.is_superuser:
+        if self.is_owner():
             return ClientForm
         raise PermissionDenied
 
 
-class ClientDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
+class ClientDeleteView(OwnerRequiredMixin, DeleteView):
     """
     Контроллер для удаления клиента
     """
     model = Client
     success_url = reverse_lazy("message:client_view")
 
-    def test_func(self):
-        """
-        Проверяет, может ли текущий пользователь удалять конкретного клиента
-        """
-        client = self.get_object()
-        user = self.request.user
-        if user.is_superuser or user == client.owner:
-            return True
 
-
-class MailingListListView(LoginRequiredMixin, ListView):
+class MailingListListView(LoginRequiredMixin, KeysetListMixin, ListView):
     """
     Контроллер для отображения всех рассылок
     """
@@ -235,12 +260,34 @@ class MailingListListView(LoginRequiredMixin, ListView):
 
     def get_queryset(self):
         """
-        Возвращает рассылки текущего пользователя
+        Возвращает рассылки текущего пользователя (с сообщением, статистикой
+        и количеством клиентов)
         """
+        mailings = MailingList.objects.select_related("message", "stats").annotate(
+            clients_count=Count("clients")
+        )
         if self.request.user.is_superuser or self.request.user.is_staff:
-            return MailingList.objects.all()
+            return mailings
         elif self.request.user.is_authenticated:
-            return MailingList.objects.filter(owner=self.request.user)
+            return mailings.filter(owner=self.request.user)
+
+    def cache_scope(self):
+        user = self.request.user
+        return ALL_OWNERS if user.is_superuser or user.is_staff else user.pk
+
+    def json_row(self, mailing):
+        stats = getattr(mailing, "stats", None)
+        return {
+            "id": mailing.pk,
+            "message": mailing.message.title_letter,
+            "status": mailing.status,
+            "periodicity": mailing.periodicity,
+            "next_date": mailing.next_date,
+            "clients_count": mailing.clients_count,
+            "stats": None
+            if stats is None
+            else {"total": stats.total, "successful": stats.successful, "failed": stats.failed},
+        }
 
 
 class MailingListCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
@@ -286,17 +333,23 @@ class MailingListDetailView(LoginRequiredMixin, DetailView):
     Контроллер для отображения конкретной рассылки
     """
     model = MailingList
+    queryset = MailingList.objects.select_related("message", "stats")
 
     def get_context_data(self, **kwargs):
         """
         Добавляет список клиентов к контексту
         """
         context_data = super().get_context_data(**kwargs)
-        context_data["clients"] = self.object.clients.all()
+        context_data["clients"] = get_or_build(
+            self.object.owner_id,
+            "mailing_clients",
+            self.object.pk,
+            lambda: list(self.object.clients.all()),
+        )
         return context_data
 
 
-class MailingListUpdateView(LoginRequiredMixin, UpdateView):
+class MailingListUpdateView(LoginRequiredMixin, OwnedObjectMixin, UpdateView):
     """
     Контроллер для создания новой рассылки
     """
@@ -320,30 +373,20 @@ class MailingListUpdateView(LoginRequiredMixin, UpdateView):
         """
         Отображает форму удаления в зависимости от текущего пользователя
         """
-        user = self.request.user
-        if self.object.owner == user or user.is_superuser:
+        if self.is_owner():
             return MailingListUpdateForm
-        elif user.has_perm("message.can_edit_status"):
+        elif self.request.user.has_perm("message.can_edit_status"):
             return MailingListModeratorForm
+        raise PermissionDenied
 
 
-class MailingListDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
+class MailingListDeleteView(OwnerRequiredMixin, DeleteView):
     """
     Контроллер для удаления рассылки
     """
     model = MailingList
     success_url = reverse_lazy("message:mailinglist_view")
 
-    def test_func(self):
-        """
-        Проверяет, может ли текущий пользователь удалять конкретную рассылку
-        """
-        user = self.request.user
-        mailing = self.get_object()
-        if user.is_superuser or user == mailing.owner:
-            return True
-        return PermissionDenied
-
 
 @login_required
 def toggle_status(request, pk):
@@ -369,30 +412,69 @@ def AttemptListView(request, pk):
     Контроллер для отображения всех попыток отправки рассылки
     """
     mailing = get_object_or_404(MailingList, pk=pk)
-    attempts = mailing.attempts.all()
-    numbers = [number for number in range(1, len(attempts) + 1)]
-    context = {"attempts": attempts, "mailing": mailing, "numbers": numbers}
+    paginator = KeysetPaginator(
+        mailing.attempts.all(), ("date_time_last_attempt", "id"), settings.ATTEMPT_PAGE_SIZE
+    )
+    try:
+        page = paginator.page(
+            after=request.GET.get("after"), before=request.GET.get("before")
+        )
+    except ValueError:
+        raise Http404
+    context = {"page": page, "attempts": page.object_list, "mailing": mailing}
     return render(request, "message/attempt_list.html", context)
 
 
+@login_required
+def attempt_export(request):
+    """
+    Потоковая выгрузка попыток отправки в CSV/JSONL с фильтрами из GET-параметров
+    """
+    form = AttemptExportForm(request.GET, user=request.user)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text())
+    data = form.cleaned_data
+    user = request.user
+    attempts = filter_attempts(
+        mailing=data["mailing"],
+        status=data["status"],
+        date_from=data["date_from"],
+        date_to=data["date_to"],
+        owner=None if user.is_superuser or user.is_staff else user,
+    )
+    export_format = data["format"] or "csv"
+    response = StreamingHttpResponse(
+        export_attempts(attempts, export_format, data["gzip"]),
+        content_type="application/gzip" if data["gzip"] else CONTENT_TYPES[export_format],
+    )
+    file_name = export_file_name(export_format, data["gzip"])
+    response["Content-Disposition"] = f'attachment; filename="{file_name}"'
+    return response
+
+
+def metrics_view(request):
+    """
+    Метрики рассылки в текстовом формате Prometheus.
+    Если задан METRICS_TOKEN, доступ по заголовку Authorization: Bearer <токен>,
+    иначе - только персоналу
+    """
+    if settings.METRICS_TOKEN:
+        token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if not constant_time_compare(token, settings.METRICS_TOKEN):
+            raise PermissionDenied
+    elif not request.user.is_staff:
+        raise PermissionDenied
+    return HttpResponse(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
+
 def HomePageView(request):
     """
     Контроллер для главной страницы
     """
     template_name = "message/home_page.html"
-    total_mailings = get_total_items_from_cache("mailing", MailingList)
-    total_active_mailings = get_total_mailings_active_from_cache()
-    total_clients = get_total_items_from_cache("clients", Client)
-    blogs = get_total_items_from_cache("blogs", Blog)
-    blogs_list = []
-    for blog in blogs:
-        blogs_list.append(blog)
-    random.shuffle(blogs_list)
-
+    blogs = get_home_page_blogs()
     context = {
-        "total_mailings": len(total_mailings),
-        "total_active_mailings": len(total_active_mailings),
-        "total_clients": len(total_clients),
-        "blogs": blogs_list[:3],
+        **get_home_page_counts(),
+        "blogs": random.sample(blogs, min(len(blogs), 3)),
     }
-    return render(request, template_name, context)
\ No newline at end of file
+    return render(request, template_name, context)
@@ -20,7 +20,7 @@ class UserUpdateForm(StyleFormMixin, ModelForm):
     """
     class Meta:
         model = User
-        fields = ("avatar", "first_name", "last_name")
+        fields = ("avatar", "first_name", "last_name", "time_zone")
 
 
 class UserModeratorForm(StyleFormMixin, ModelForm):
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.16 on 2026-10-18 15:20
+
+from django.db import migrations, models
+import users.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='time_zone',
+            field=models.CharField(default='UTC', max_length=64, validators=[users.models.validate_time_zone], verbose_name='Часовой пояс'),
+        ),
+    ]
@@ -1,7 +1,18 @@
+import zoneinfo
+
 from django.contrib.auth.models import AbstractUser
+from django.core.exceptions import ValidationError
 from django.db import models
 
 
+def validate_time_zone(value):
+    """
+    Проверяет, что часовой пояс есть в базе IANA
+    """
+    if value not in zoneinfo.available_timezones():
+        raise ValidationError(f"Неизвестный часовой пояс: {value}")
+
+
 class User(AbstractUser):
     """
     Модель Пользователя
@@ -26,6 +37,12 @@ class User(AbstractUser):
     last_name = models.CharField(
         max_length=50, verbose_name="Фамилия", blank=True, null=True
     )
+    time_zone = models.CharField(
+        max_length=64,
+        verbose_name="Часовой пояс",
+        default="UTC",
+        validators=[validate_time_zone],
+    )
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
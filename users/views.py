@@ -10,6 +10,7 @@ from django.urls import reverse_lazy, reverse
 from django.views.generic import CreateView, DetailView, UpdateView, DeleteView, ListView
 
 from config.settings import EMAIL_HOST_USER
+from message.smtp_pool import get_connection_pool
 from users.forms import UserRegisterForm, UserUpdateForm, UserModeratorForm
 from users.models import User
 
@@ -31,12 +32,14 @@ class UserRegisterView(CreateView):
         user.save()
         host = self.request.get_host()
         url = f"http://{host}/users/email-confirm/{token}"
-        send_mail(
-            "Подтверждение почты",
-            f"Перейдите по ссылке для подтверждения почты: {url}",
-            EMAIL_HOST_USER,
-            [user.email],
-        )
+        with get_connection_pool().connection() as connection:
+            send_mail(
+                "Подтверждение почты",
+                f"Перейдите по ссылке для подтверждения почты: {url}",
+                EMAIL_HOST_USER,
+                [user.email],
+                connection=connection,
+            )
         return super().form_valid(form)
 
 